@@ -1,21 +1,96 @@
 import argparse
-import copy
-import re
+import hashlib
 import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+# Parser para cuerpos HTTP grandes (todos aceptan bytes): orjson, luego ujson, luego json estándar
+if orjson is not None:
+    _loads_bytes = orjson.loads
+else:
+    try:
+        import ujson  # type: ignore
+
+        _loads_bytes = ujson.loads
+    except ImportError:
+        _loads_bytes = json.loads
+
+_NON_DIGIT_RE = re.compile(r"\D+")
+# Caché en disco de get_users: el directorio de usuarios cambia lento (minutos/horas)
+USERS_CACHE_PATH = Path.home() / ".cache" / "naoweesuite" / "users.json"
+DEFAULT_USERS_TTL = 60.0
+# Buffer de 1 MiB para escribir cada JSON con la menor cantidad de write()
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Sesión compartida: reutiliza conexiones (keep-alive) entre llamadas al mismo host
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504]),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+
+def get_session() -> requests.Session:
+    """Devuelve la sesión HTTP compartida del módulo."""
+    return _SESSION
+
+
+def load_json(path: Union[str, Path]) -> Any:
+    if orjson is not None:
+        # orjson parsea directamente los bytes (sin decodificar a str)
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
-def load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+def save_json(path: Union[str, Path], data: Any) -> None:
+    # Escritura atómica: se escribe a un temporal y se renombra con os.replace, así un
+    # proceso interrumpido nunca deja un JSON a medio escribir
+    tmp_path = os.fspath(path) + ".tmp"
+    try:
+        if orjson is not None:
+            # orjson siempre emite UTF-8 (equivalente a ensure_ascii=False) con indentación de 2
+            with open(tmp_path, "wb", buffering=_WRITE_BUFFER_SIZE) as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(tmp_path, "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
 
-def save_json(path: Path, data: Any) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def list_json_names(dir_path: Union[str, Path]) -> List[str]:
+    """Nombres de los *.json de dir_path ordenados (una sola pasada con os.scandir)."""
+    with os.scandir(dir_path) as it:
+        return sorted(e.name for e in it if e.name.endswith(".json") and e.is_file())
 
 
 def load_uris(uris_path: Path) -> Dict[str, Any]:
@@ -28,7 +103,50 @@ def load_config(config_path: Path) -> Dict[str, Any]:
     return load_json(config_path)
 
 
-def fetch_get_beneficiary(uris: Dict[str, Any], user_id: Any, *, token: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+def load_beneficiary_cache(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Carga el caché de get_beneficiary: {user_id: {identity, etag, last_modified, fetched_at, body}}. Si no existe o es inválido, {}."""
+    if not path.exists():
+        return {}
+    try:
+        data = load_json(path)
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_beneficiary_cache(path: Path, cache: Dict[str, Dict[str, Any]], user_ids: Iterable[Any]) -> None:
+    """Guarda el caché de get_beneficiary conservando solo los user_id de la corrida actual.
+
+    Así el archivo no acumula indefinidamente datos de beneficiarios que ya no se procesan.
+    """
+    keep = {str(u) for u in user_ids}
+    save_json(path, {k: v for k, v in cache.items() if k in keep})
+
+
+def _cache_identity(url: str, headers: Dict[str, str]) -> str:
+    """Hash de la URL y los headers (incluido el token): otro entorno, usuario o configuración no
+    comparte caché. Se guarda solo el hash para no dejar el token en disco.
+    """
+    raw = json.dumps([url, sorted(headers.items())], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def fetch_get_beneficiary(
+    uris: Dict[str, Any],
+    user_id: Any,
+    *,
+    token: Optional[str] = None,
+    extra_headers: Optional[Dict[str, str]] = None,
+    cache: Optional[Dict[str, Dict[str, Any]]] = None,
+    ttl: float = 0.0,
+) -> Dict[str, Any]:
+    """Obtiene el beneficiary de user_id.
+
+    Si se pasa `cache`, se envía un GET condicional (If-None-Match / If-Modified-Since) con los
+    validadores guardados; ante un 304 se devuelve el cuerpo cacheado y ante un 200 se actualiza.
+    Con ttl > 0, una entrada consultada hace menos de `ttl` segundos se devuelve sin ir a la red.
+    Cada entrada guarda el hash de URL + headers; si no coincide (otro URIS.json o token) se ignora.
+    """
     ep = uris.get("endpoints", {}).get("get_beneficiary")
     if not ep:
         raise RuntimeError("Endpoint 'get_beneficiary' no encontrado en URIS.json")
@@ -48,20 +166,83 @@ def fetch_get_beneficiary(uris: Dict[str, Any], user_id: Any, *, token: Optional
     if extra_headers:
         headers.update(extra_headers)
 
-    resp = requests.get(url, headers=headers or None, timeout=30)
+    cache_key = str(user_id)
+    identity = _cache_identity(url, headers)
+    cached = cache.get(cache_key) if cache is not None else None
+    if not (isinstance(cached, dict) and isinstance(cached.get("body"), dict) and cached.get("identity") == identity):
+        cached = None
+    if cached is not None:
+        fetched_at = cached.get("fetched_at")
+        if ttl > 0 and isinstance(fetched_at, (int, float)) and time.time() - fetched_at < ttl:
+            return cached["body"]
+        if cached.get("etag"):
+            headers["If-None-Match"] = str(cached["etag"])
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = str(cached["last_modified"])
+
+    resp = _SESSION.get(url, headers=headers or None, timeout=30)
+    if resp.status_code == 304 and cached is not None:
+        cached["fetched_at"] = time.time()
+        return cached["body"]
     resp.raise_for_status()
     data = resp.json()
     if isinstance(data, dict):
+        if cache is not None:
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+            if etag or last_modified or ttl > 0:
+                cache[cache_key] = {"identity": identity, "etag": etag, "last_modified": last_modified, "fetched_at": time.time(), "body": data}
         return data
     raise RuntimeError("Respuesta inesperada del endpoint get_beneficiary (se esperaba objeto)")
 
 
 def normalize_digits(x: Any) -> str:
     s = "" if x is None else str(x)
-    return re.sub(r"\D+", "", s)
-
-
-def fetch_get_users(uris: Dict[str, Any], *, token: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None):
+    # Caso común: el documento ya viene solo con dígitos
+    if s.isdecimal():
+        return s
+    return _NON_DIGIT_RE.sub("", s)
+
+
+def _rename_cedula(d: Dict[str, Any]) -> None:
+    """Renombra 'cedula' -> 'beneficiary_document' (como string) si aún no existe."""
+    if "cedula" in d and "beneficiary_document" not in d:
+        d["beneficiary_document"] = str(d.pop("cedula") or "")
+
+
+def _read_users_cache(path: Path, identity: str) -> Optional[Dict[str, Any]]:
+    """Lee el caché de get_users; solo es válido si corresponde a la misma URL, token y headers."""
+    try:
+        cached = load_json(path)
+    except Exception:
+        return None
+    if isinstance(cached, dict) and cached.get("identity") == identity and isinstance(cached.get("body"), list):
+        return cached
+    return None
+
+
+def _write_users_cache(path: Path, entry: Dict[str, Any]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        save_json(path, entry)
+    except Exception as e:
+        log.warning("[WARN] No se pudo guardar el caché de usuarios: %s", e)
+
+
+def fetch_get_users(
+    uris: Dict[str, Any],
+    *,
+    token: Optional[str] = None,
+    extra_headers: Optional[Dict[str, str]] = None,
+    cache_path: Optional[Path] = None,
+    ttl: float = DEFAULT_USERS_TTL,
+) -> List[Dict[str, Any]]:
+    """Obtiene el listado de usuarios del endpoint get_users.
+
+    Con `cache_path`, la respuesta se guarda en disco junto a su ETag: dentro de `ttl` segundos se
+    devuelve sin consultar; vencido el TTL se hace un GET condicional (If-None-Match) y un 304
+    reutiliza el cuerpo cacheado.
+    """
     ep = uris.get("endpoints", {}).get("get_users")
     if not ep:
         raise RuntimeError("Endpoint 'get_users' no encontrado en URIS.json")
@@ -78,19 +259,47 @@ def fetch_get_users(uris: Dict[str, Any], *, token: Optional[str] = None, extra_
     if extra_headers:
         headers.update(extra_headers)
 
-    resp = requests.get(url, headers=headers or None, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
-    if isinstance(data, dict):
-        items = data.get("items")
-        if isinstance(items, list):
-            return items
-    if isinstance(data, list):
-        return data
-    raise RuntimeError("Respuesta inesperada del endpoint get_users")
+    identity = _cache_identity(url, headers)
+    cached = _read_users_cache(cache_path, identity) if cache_path is not None else None
+    if cached is not None:
+        fetched_at = cached.get("fetched_at")
+        if isinstance(fetched_at, (int, float)) and time.time() - fetched_at < ttl:
+            return cached["body"]
+        if cached.get("etag"):
+            headers["If-None-Match"] = str(cached["etag"])
+
+    # Leer el cuerpo como bytes y parsearlo directamente: evita la copia intermedia a str
+    # que hace resp.json() sobre un listado que puede ser de decenas de MB
+    with _SESSION.get(url, headers=headers or None, timeout=30, stream=True) as resp:
+        if resp.status_code == 304 and cached is not None:
+            cached["fetched_at"] = time.time()
+            _write_users_cache(cache_path, cached)
+            return cached["body"]
+        resp.raise_for_status()
+        etag = resp.headers.get("ETag")
+        body = resp.content
+    data = _loads_bytes(body)
+    del body
+    users: Optional[List[Dict[str, Any]]] = None
+    # Esperamos { items: [...] }
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        users = data["items"]
+    # Alternativa: si retorna lista directamente
+    elif isinstance(data, list):
+        users = data
+    if users is None:
+        raise RuntimeError("Respuesta inesperada del endpoint get_users")
+    if cache_path is not None:
+        _write_users_cache(cache_path, {"url": url, "identity": identity, "fetched_at": time.time(), "etag": etag, "body": users})
+    return users
 
 
 def get_payload_reference(uris: Dict[str, Any], template_name: str) -> Dict[str, Any]:
+    """Devuelve el dict 'reference' de la plantilla tal cual está en `uris` (sin copiar).
+
+    Es de solo lectura por contrato: build_payload arma cada payload sobre una copia
+    superficial y nunca muta el template ni sus sub-objetos.
+    """
     templates = uris.get("payload_templates", {})
     if not isinstance(templates, dict):
         raise RuntimeError("'payload_templates' inválido en URIS.json")
@@ -100,61 +309,56 @@ def get_payload_reference(uris: Dict[str, Any], template_name: str) -> Dict[str,
     ref = tpl.get("reference")
     if not isinstance(ref, dict):
         raise RuntimeError(f"'reference' inválido en plantilla '{template_name}'")
-    return copy.deepcopy(ref)
+    return ref
 
 
 def build_payload(reference: Dict[str, Any], mapped: Dict[str, Any], beneficiary: Dict[str, Any]) -> Dict[str, Any]:
-    # Copia profunda para no mutar el template
-    payload = json.loads(json.dumps(reference))
+    # Copia superficial para no mutar el template: solo se reasignan llaves de primer nivel,
+    # los sub-objetos del template (p. ej. 'data') se comparten sin modificarse
+    return _fill_payload(dict(reference), mapped, beneficiary)
+
+
+def compile_payload_builder(reference: Dict[str, Any]) -> Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]:
+    """Liga la plantilla una sola vez y devuelve build(mapped, beneficiary) -> payload.
+
+    Equivale a build_payload(reference, ...) pero sin pasar ni revalidar el template en cada
+    archivo: la copia superficial se hace con el método `copy` ya resuelto.
+    """
+    copy_reference = reference.copy
+
+    def build(mapped: Dict[str, Any], beneficiary: Dict[str, Any]) -> Dict[str, Any]:
+        return _fill_payload(copy_reference(), mapped, beneficiary)
+
+    return build
+
+
+def _fill_payload(payload: Dict[str, Any], mapped: Dict[str, Any], beneficiary: Dict[str, Any]) -> Dict[str, Any]:
+    # Un solo chequeo de tipo por objeto; el resto son lecturas directas
+    m = mapped if isinstance(mapped, dict) else {}
+    ben = beneficiary if isinstance(beneficiary, dict) else {}
 
-    # Valores desde JSON mapeado
-    beneficiary_id = mapped.get("id")
-    categories = mapped.get("categories") or []
-    budget_id = mapped.get("budget_id")
     # Documento del beneficiario como string; aceptar ya renombrado o 'cedula'
-    raw_doc = mapped.get("beneficiary_document") if isinstance(mapped, dict) else None
-    if not raw_doc:
-        raw_doc = mapped.get("cedula") if isinstance(mapped, dict) else None
-    beneficiary_document = "" if raw_doc is None else str(raw_doc)
+    raw_doc = m.get("beneficiary_document") or m.get("cedula")
 
     # Valores desde beneficiary (endpoint)
-    contractor_id = None
-    contract_id = None
-    department_id = None
-    municipality_id = None
-
-    contractor = beneficiary.get("contractor") if isinstance(beneficiary, dict) else None
-    contract = beneficiary.get("contract") if isinstance(beneficiary, dict) else None
-    department = beneficiary.get("department") if isinstance(beneficiary, dict) else None
-    municipality = beneficiary.get("municipality") if isinstance(beneficiary, dict) else None
-
-    if isinstance(contractor, dict):
-        contractor_id = contractor.get("contractor_id")
-    if isinstance(contract, dict):
-        contract_id = contract.get("id")
-    if isinstance(department, dict):
-        department_id = department.get("id")
-    if isinstance(municipality, dict):
-        municipality_id = municipality.get("id")
+    contractor = ben.get("contractor")
+    contract = ben.get("contract")
+    department = ben.get("department")
+    municipality = ben.get("municipality")
+    contractor_id = contractor.get("contractor_id") if isinstance(contractor, dict) else None
 
     # Reemplazar placeholders del template por valores con el tipo correcto
-    payload["beneficiary_id"] = beneficiary_id
+    payload["beneficiary_id"] = m.get("id")
     # Forzar contractor_id como string si existe (requerimiento del usuario)
-    if contractor_id is not None:
-        try:
-            payload["contractor_id"] = str(contractor_id)
-        except Exception:
-            payload["contractor_id"] = contractor_id
-    else:
-        payload["contractor_id"] = contractor_id
-    payload["contract_id"] = contract_id
-    payload["department_id"] = department_id
-    payload["municipality_id"] = municipality_id
-    payload["categories"] = categories
-    payload["update_aiu"] = bool(False)
-    payload["budget_id"] = budget_id
+    payload["contractor_id"] = None if contractor_id is None else str(contractor_id)
+    payload["contract_id"] = contract.get("id") if isinstance(contract, dict) else None
+    payload["department_id"] = department.get("id") if isinstance(department, dict) else None
+    payload["municipality_id"] = municipality.get("id") if isinstance(municipality, dict) else None
+    payload["categories"] = m.get("categories") or []
+    payload["update_aiu"] = False
+    payload["budget_id"] = m.get("budget_id")
     # Añadir beneficiary_document para trazabilidad según solicitud
-    payload["beneficiary_document"] = beneficiary_document
+    payload["beneficiary_document"] = "" if raw_doc is None else str(raw_doc)
 
     return payload
 
@@ -170,15 +374,21 @@ def parse_args() -> argparse.Namespace:
     # Enriquecimiento opcional (uno solo comando)
     p.add_argument("--enrich-users", action="store_true", help="Enriquece con get_users antes de construir payloads")
     p.add_argument("--users-file", default=None, help="Archivo JSON local de get_users para modo offline")
+    p.add_argument("--users-ttl", type=float, default=DEFAULT_USERS_TTL, help="Segundos en que el caché de get_users se usa sin consultar (por defecto: 60)")
+    p.add_argument("--no-users-cache", action="store_true", help="No usar ni actualizar el caché en disco de get_users")
     p.add_argument("--template", default="budget_payload", help="Nombre de la plantilla en URIS.json (por defecto: budget_payload)")
+    p.add_argument("--ben-cache", default=".ben_cache.json", help="Caché de get_beneficiary para GET condicionales (por defecto: .ben_cache.json)")
+    p.add_argument("--no-ben-cache", action="store_true", help="No usar ni actualizar el caché de get_beneficiary")
+    p.add_argument("--max-workers", type=int, default=16, help="Consultas get_beneficiary concurrentes (por defecto: 16)")
     return p.parse_args()
 
 
 def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     args = parse_args()
     mapped_dir = Path(args.mapped_dir)
     if not mapped_dir.exists():
-        print(f"[ERROR] Carpeta no encontrada: {mapped_dir.resolve()}")
+        log.error("[ERROR] Carpeta no encontrada: %s", mapped_dir.resolve())
         return
 
     uris = load_uris(Path(args.uris))
@@ -196,7 +406,7 @@ def main() -> None:
     extra_headers = {str(k): str(v) for k, v in cfg_headers.items()} if isinstance(cfg_headers, dict) else None
 
     # Cargar template de referencia
-    reference = get_payload_reference(uris, args.template)
+    build = compile_payload_builder(get_payload_reference(uris, args.template))
 
     # Cargar beneficiary offline si aplica
     beneficiary_offline: Optional[Dict[str, Any]] = None
@@ -205,16 +415,17 @@ def main() -> None:
             beneficiary_offline = load_json(Path(args.beneficiary_file))
             if not isinstance(beneficiary_offline, dict):
                 raise RuntimeError("El beneficiary-file debe contener un objeto JSON")
-            print(f"[INFO] Usando beneficiary desde archivo local: {args.beneficiary_file}")
+            log.info("[INFO] Usando beneficiary desde archivo local: %s", args.beneficiary_file)
         except Exception as e:
-            print(f"[ERROR] No se pudo leer beneficiary-file: {e}")
+            log.error("[ERROR] No se pudo leer beneficiary-file: %s", e)
             return
 
     out_dir = Path(args.payload_dir) if args.payload_dir else mapped_dir
     out_dir.mkdir(parents=True, exist_ok=True)
 
     # Si se solicita, preparar mapa de usuarios (get_users) para enriquecer
-    user_map: Optional[Dict[str, Dict[str, Any]]] = None
+    # document_number (entero) -> (budget_id, id)
+    user_map: Optional[Dict[int, Tuple[Any, Any]]] = None
     if args.enrich_users:
         try:
             if args.users_file:
@@ -225,45 +436,49 @@ def main() -> None:
                     users = users_raw
                 else:
                     raise RuntimeError("Formato inválido en users-file")
-                print(f"[INFO] Usuarios desde archivo local: {len(users)}")
+                log.info("[INFO] Usuarios desde archivo local: %s", len(users))
             else:
-                print("[INFO] Consultando endpoint get_users...")
-                users = fetch_get_users(uris, token=token, extra_headers=extra_headers)
-                print(f"[INFO] Usuarios recibidos: {len(users)}")
-            m: Dict[str, Dict[str, Any]] = {}
-            for u in users:
-                doc = normalize_digits(u.get("document_number"))
-                if not doc:
-                    continue
-                m[doc] = {"budget_id": u.get("budget_id"), "id": u.get("id")}
-            user_map = m
+                log.info("[INFO] Consultando endpoint get_users...")
+                users_cache = None if args.no_users_cache else USERS_CACHE_PATH
+                users = fetch_get_users(uris, token=token, extra_headers=extra_headers, cache_path=users_cache, ttl=args.users_ttl)
+                log.info("[INFO] Usuarios recibidos: %s", len(users))
+            # `for doc in (...,)` liga el documento normalizado una sola vez por usuario
+            user_map = {
+                int(doc): (u.get("budget_id"), u.get("id"))
+                for u in users
+                for doc in (normalize_digits(u.get("document_number")),)
+                if doc
+            }
+            # Solo se conservan document_number -> (budget_id, id); liberar el listado completo
+            del users
         except Exception as e:
-            print(f"[WARN] No se pudo preparar el mapa de usuarios: {e}")
+            log.warning("[WARN] No se pudo preparar el mapa de usuarios: %s", e)
             user_map = None
 
     built = 0
     skipped_false: list[dict] = []
-    for p in sorted(mapped_dir.glob("*.json")):
+    # Rutas como str con os.path.join: evita la aritmética de Path por archivo
+    mapped_dir_str = str(mapped_dir)
+    out_dir_str = str(out_dir)
+    # Archivos listos para construir payload: (nombre, json mapeado, user_id)
+    pending: List[Tuple[str, Dict[str, Any], Any]] = []
+    for name in list_json_names(mapped_dir_str):
+        src_path = os.path.join(mapped_dir_str, name)
         try:
-            mapped = load_json(p)
+            mapped = load_json(src_path)
         except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}': {e}")
+            log.warning("[WARN] No se pudo leer '%s': %s", name, e)
             continue
 
-        # Enriquecimiento por archivo (si aplica): renombrar cedula y setear id/budget_id/exist
+        # Enriquecimiento por archivo (si aplica): renombrar cedula y setear id/budget_id/exist.
+        # Con user_map cargado siempre se vuelve a consultar (es un acceso a dict): un exist/id
+        # guardado por una corrida previa puede estar desactualizado y no debe decidir el borrado
         if user_map is not None:
-            if "cedula" in mapped and "beneficiary_document" not in mapped:
-                try:
-                    mapped["beneficiary_document"] = str(mapped.get("cedula") or "")
-                    del mapped["cedula"]
-                except Exception:
-                    mapped["beneficiary_document"] = str(mapped.get("cedula"))
-                    mapped.pop("cedula", None)
+            _rename_cedula(mapped)
             ced = normalize_digits(mapped.get("beneficiary_document")) or normalize_digits(mapped.get("cedula"))
-            info = user_map.get(ced) if ced else None
+            info = user_map.get(int(ced)) if ced else None
             if info:
-                mapped["budget_id"] = info.get("budget_id")
-                mapped["id"] = info.get("id")
+                mapped["budget_id"], mapped["id"] = info
                 mapped["exist"] = True
             else:
                 mapped.setdefault("budget_id", None)
@@ -273,38 +488,62 @@ def main() -> None:
         # Si no existe el usuario (exist=false), no construir payload
         if mapped.get("exist") is False:
             skipped_false.append({
-                "file": p.name,
+                "file": name,
                 "beneficiary_document": normalize_digits(mapped.get("beneficiary_document")) or "",
             })
-            print(f"[INFO] '{p.name}' exist=false; eliminar y omitir payload")
+            log.info("[INFO] '%s' exist=false; eliminar y omitir payload", name)
             try:
-                p.unlink(missing_ok=True)
+                os.unlink(src_path)
             except Exception:
                 pass
             continue
 
         user_id = mapped.get("id")
         if user_id is None and not beneficiary_offline:
-            print(f"[WARN] '{p.name}' no tiene 'id' y no hay beneficiary offline; se omite")
+            log.warning("[WARN] '%s' no tiene 'id' y no hay beneficiary offline; se omite", name)
             continue
 
-        # Obtener beneficiary por archivo (online u offline)
-        try:
-            if beneficiary_offline is not None:
-                ben = beneficiary_offline
-            else:
-                ben = fetch_get_beneficiary(uris, user_id, token=token, extra_headers=extra_headers)
-        except Exception as e:
-            print(f"[WARN] No se pudo obtener beneficiary para '{p.name}': {e}")
-            continue
+        pending.append((name, mapped, user_id))
+
+    # Obtener beneficiaries (online en paralelo u offline)
+    if beneficiary_offline is not None:
+        fetched = [(name, mapped, beneficiary_offline, None) for name, mapped, _ in pending]
+    else:
+        # Caché en disco entre corridas (ETag/Last-Modified) para GET condicionales
+        http_cache_path = None if args.no_ben_cache else Path(args.ben_cache)
+        http_cache = load_beneficiary_cache(http_cache_path) if http_cache_path is not None else None
 
-        payload = build_payload(reference, mapped, ben)
-        out_path = out_dir / p.name
+        # Una sola consulta por user_id: archivos que comparten id reutilizan la respuesta
+        ben_cache: Dict[Any, Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = {}
+
+        def _fetch(user_id: Any) -> Tuple[Any, Optional[Dict[str, Any]], Optional[Exception]]:
+            try:
+                return user_id, fetch_get_beneficiary(uris, user_id, token=token, extra_headers=extra_headers, cache=http_cache), None
+            except Exception as e:
+                return user_id, None, e
+
+        unique_ids = list(dict.fromkeys(user_id for _, _, user_id in pending))
+        with ThreadPoolExecutor(max_workers=max(1, args.max_workers)) as executor:
+            for user_id, ben, err in executor.map(_fetch, unique_ids):
+                ben_cache[user_id] = (ben, err)
+        if http_cache_path is not None and unique_ids:
+            try:
+                save_beneficiary_cache(http_cache_path, http_cache, unique_ids)
+            except Exception as e:
+                log.warning("[WARN] No se pudo guardar el caché de beneficiaries: %s", e)
+        fetched = [(name, mapped, *ben_cache[user_id]) for name, mapped, user_id in pending]
+
+    for name, mapped, ben, err in fetched:
+        if err is not None:
+            log.warning("[WARN] No se pudo obtener beneficiary para '%s': %s", name, err)
+            continue
+        payload = build(mapped, ben)
+        out_path = os.path.join(out_dir_str, name)
         save_json(out_path, payload)
-        print(f"[OK] Payload -> {out_path}")
+        log.info("[OK] Payload -> %s", out_path)
         built += 1
 
-    print(f"[RESUMEN] Payloads generados: {built} en '{out_dir.resolve()}'")
+    log.info("[RESUMEN] Payloads generados: %s en '%s'", built, out_dir.resolve())
 
 
 if __name__ == "__main__":
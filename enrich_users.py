@@ -1,25 +1,77 @@
 import argparse
 import json
+import logging
+import os
 import re
+import sys
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Tuple, Union
 
-import requests
+# get_users (con su caché en disco y la sesión HTTP compartida) es el mismo de build_payloads
+from build_payloads import DEFAULT_USERS_TTL, USERS_CACHE_PATH, fetch_get_users
 
+log = logging.getLogger(__name__)
 
-def load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as f:
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+_NON_DIGIT_RE = re.compile(r"\D+")
+# Buffer de 1 MiB para escribir cada JSON con la menor cantidad de write()
+_WRITE_BUFFER_SIZE = 1 << 20
+
+
+def load_json(path: Union[str, Path]) -> Any:
+    if orjson is not None:
+        # orjson parsea directamente los bytes (sin decodificar a str)
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def save_json(path: Path, data: Any) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def save_json(path: Union[str, Path], data: Any) -> None:
+    # Escritura atómica: se escribe a un temporal y se renombra con os.replace, así un
+    # proceso interrumpido nunca deja un JSON a medio escribir
+    tmp_path = os.fspath(path) + ".tmp"
+    try:
+        if orjson is not None:
+            # orjson siempre emite UTF-8 (equivalente a ensure_ascii=False) con indentación de 2
+            with open(tmp_path, "wb", buffering=_WRITE_BUFFER_SIZE) as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(tmp_path, "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
 
 def normalize_digits(x: Any) -> str:
     s = "" if x is None else str(x)
-    return re.sub(r"\D+", "", s)
+    # Caso común: el documento ya viene solo con dígitos
+    if s.isdecimal():
+        return s
+    return _NON_DIGIT_RE.sub("", s)
+
+
+def _rename_cedula(d: Dict[str, Any]) -> None:
+    """Renombra 'cedula' -> 'beneficiary_document' (como string) si aún no existe."""
+    if "cedula" in d and "beneficiary_document" not in d:
+        d["beneficiary_document"] = str(d.pop("cedula") or "")
+
+
+def list_json_names(dir_path: Union[str, Path]) -> List[str]:
+    """Nombres de los *.json de dir_path ordenados (una sola pasada con os.scandir)."""
+    with os.scandir(dir_path) as it:
+        return sorted(e.name for e in it if e.name.endswith(".json") and e.is_file())
 
 
 def load_uris(uris_path: Path) -> Dict[str, Any]:
@@ -32,37 +84,6 @@ def load_config(config_path: Path) -> Dict[str, Any]:
     return load_json(config_path)
 
 
-def fetch_get_users(uris: Dict[str, Any], *, token: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
-    ep = uris.get("endpoints", {}).get("get_users")
-    if not ep:
-        raise RuntimeError("Endpoint 'get_users' no encontrado en URIS.json")
-    url = ep.get("uri")
-    method = (ep.get("method") or "GET").upper()
-    if method != "GET":
-        raise RuntimeError("El endpoint get_users debe ser GET")
-    headers: Dict[str, str] = {}
-    cfg_headers = ep.get("headers")
-    if isinstance(cfg_headers, dict):
-        headers.update({str(k): str(v) for k, v in cfg_headers.items()})
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    if extra_headers:
-        headers.update(extra_headers)
-
-    resp = requests.get(url, headers=headers or None, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
-    # Esperamos { items: [...] }
-    if isinstance(data, dict):
-        items = data.get("items")
-        if isinstance(items, list):
-            return items
-    # Alternativa: si retorna lista directamente
-    if isinstance(data, list):
-        return data
-    raise RuntimeError("Respuesta inesperada del endpoint get_users")
-
-
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Enriquece JSONs mapeados con budget_id e id desde get_users, emparejando por cédula.")
     p.add_argument("--mapped-dir", default="output_json_mapped", help="Carpeta con JSONs mapeados a actualizar (por defecto: output_json_mapped)")
@@ -70,15 +91,18 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--config", default="config.json", help="Ruta a config.json (por defecto: config.json)")
     p.add_argument("--auth-token", default=None, help="Token Bearer (prioriza sobre config)")
     p.add_argument("--users-file", default=None, help="Archivo JSON local con respuesta de get_users para modo offline")
+    p.add_argument("--users-ttl", type=float, default=DEFAULT_USERS_TTL, help="Segundos en que el caché de get_users se usa sin consultar (por defecto: 60)")
+    p.add_argument("--no-users-cache", action="store_true", help="No usar ni actualizar el caché en disco de get_users")
     p.add_argument("--output-dir", default=None, help="Carpeta de salida; si no se especifica, sobreescribe en mapped-dir")
     return p.parse_args()
 
 
 def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     args = parse_args()
     mapped_dir = Path(args.mapped_dir)
     if not mapped_dir.exists():
-        print(f"[ERROR] Carpeta no encontrada: {mapped_dir.resolve()}")
+        log.error("[ERROR] Carpeta no encontrada: %s", mapped_dir.resolve())
         return
 
     uris = load_uris(Path(args.uris))
@@ -102,62 +126,57 @@ def main() -> None:
             users = users_raw
         else:
             raise RuntimeError("Formato inválido en users-file")
-        print(f"[INFO] Usuarios desde archivo local: {len(users)}")
+        log.info("[INFO] Usuarios desde archivo local: %s", len(users))
     else:
-        print("[INFO] Consultando endpoint get_users...")
-        users = fetch_get_users(uris, token=token, extra_headers=extra_headers)
-        print(f"[INFO] Usuarios recibidos: {len(users)}")
-
-    # Construir mapa por cédula (document_number)
-    user_map: Dict[str, Dict[str, Any]] = {}
-    for u in users:
-        doc = normalize_digits(u.get("document_number"))
-        if not doc:
-            continue
-        user_map[doc] = {
-            "budget_id": u.get("budget_id"),
-            "id": u.get("id"),
-        }
+        log.info("[INFO] Consultando endpoint get_users...")
+        users_cache = None if args.no_users_cache else USERS_CACHE_PATH
+        users = fetch_get_users(uris, token=token, extra_headers=extra_headers, cache_path=users_cache, ttl=args.users_ttl)
+        log.info("[INFO] Usuarios recibidos: %s", len(users))
+
+    # Construir mapa por cédula: document_number (entero) -> (budget_id, id)
+    # `for doc in (...,)` liga el documento normalizado una sola vez por usuario
+    user_map: Dict[int, Tuple[Any, Any]] = {
+        int(doc): (u.get("budget_id"), u.get("id"))
+        for u in users
+        for doc in (normalize_digits(u.get("document_number")),)
+        if doc
+    }
 
     out_dir = Path(args.output_dir) if args.output_dir else mapped_dir
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    # Rutas como str con os.path.join: evita la aritmética de Path por archivo
+    mapped_dir_str = str(mapped_dir)
+    out_dir_str = str(out_dir)
     updated = 0
-    for p in sorted(mapped_dir.glob("*.json")):
+    for name in list_json_names(mapped_dir_str):
         try:
-            data = load_json(p)
+            data = load_json(os.path.join(mapped_dir_str, name))
         except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}': {e}")
+            log.warning("[WARN] No se pudo leer '%s': %s", name, e)
             continue
 
         # Renombrar 'cedula' -> 'beneficiary_document' como string
-        if "cedula" in data and "beneficiary_document" not in data:
-            try:
-                data["beneficiary_document"] = str(data.get("cedula") or "")
-                del data["cedula"]
-            except Exception:
-                data["beneficiary_document"] = str(data.get("cedula"))
-                data.pop("cedula", None)
+        _rename_cedula(data)
 
         ced = normalize_digits(data.get("beneficiary_document")) or normalize_digits(data.get("cedula"))
-        info = user_map.get(ced)
+        info = user_map.get(int(ced)) if ced else None
 
         # Asegurar llaves presentes; si no hay match, se establecen en null
         if info:
-            data["budget_id"] = info.get("budget_id")
-            data["id"] = info.get("id")
+            data["budget_id"], data["id"] = info
             data["exist"] = True
         else:
             data.setdefault("budget_id", None)
             data.setdefault("id", None)
             data["exist"] = False
 
-    out_path = out_dir / p.name
-    save_json(out_path, data)
-    print(f"[OK] Actualizado -> {out_path}")
-    updated += 1
+        out_path = os.path.join(out_dir_str, name)
+        save_json(out_path, data)
+        log.info("[OK] Actualizado -> %s", out_path)
+        updated += 1
 
-    print(f"[RESUMEN] Archivos actualizados: {updated} en '{out_dir.resolve()}'")
+    log.info("[RESUMEN] Archivos actualizados: %s en '%s'", updated, out_dir.resolve())
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 import argparse
+import logging
 import os
 import shutil
+import sys
 from pathlib import Path
 
+log = logging.getLogger(__name__)
+
 
 def is_temp_excel(name: str) -> bool:
     # Archivos temporales de Excel suelen empezar por ~$
@@ -24,7 +28,7 @@ def unique_destination(dir_path: Path, file_name: str) -> Path:
 def move_excels_to_root(input_root: Path) -> int:
     """Mueve todos los .xlsx de subcarpetas a input_root. Devuelve la cantidad movida."""
     if not input_root.exists():
-        print(f"[INFO] La carpeta '{input_root}' no existe. Creándola...")
+        log.info("[INFO] La carpeta '%s' no existe. Creándola...", input_root)
         input_root.mkdir(parents=True, exist_ok=True)
         return 0
 
@@ -36,31 +40,56 @@ def move_excels_to_root(input_root: Path) -> int:
         if p.parent == input_root:
             continue
         dest = unique_destination(input_root, p.name)
-        print(f"[MOVE] {p.relative_to(input_root)} -> {dest.name}")
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(p), str(dest))
+        log.info("[MOVE] %s -> %s", p.relative_to(input_root), dest.name)
+        # Mismo sistema de archivos (caso común): un solo rename; si falla (p. ej. otro
+        # dispositivo), shutil.move copia y elimina el original
+        try:
+            os.rename(p, dest)
+        except OSError:
+            shutil.move(str(p), str(dest))
         moved += 1
 
     return moved
 
 
 def remove_empty_dirs(input_root: Path) -> int:
-    """Elimina directorios vacíos bajo input_root. Devuelve cuántos borró."""
+    """Elimina directorios vacíos bajo input_root. Devuelve cuántos borró.
+
+    Recorre con os.scandir (DirEntry cachea el tipo, sin stat extra por entrada) y, al volver de
+    la recursión, borra también las carpetas que quedaron vacías al eliminar sus hijas.
+    """
     removed = 0
-    # Caminar de abajo hacia arriba
-    for root, dirs, files in os.walk(input_root, topdown=False):
-        path_obj = Path(root)
-        if path_obj == input_root:
-            continue
-        # Si no quedan archivos ni subdirectorios
-        if not dirs and not files:
-            try:
-                path_obj.rmdir()
-                print(f"[RMDIR] {path_obj.relative_to(input_root)}")
-                removed += 1
-            except OSError:
-                # Si no está vacío por algún motivo, ignorar
-                pass
+
+    def _clean(d: str) -> bool:
+        # True si `d` quedó vacío (y fue borrado)
+        nonlocal removed
+        empty = True
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if not (e.is_dir(follow_symlinks=False) and _clean(e.path)):
+                        empty = False
+        except OSError:
+            # Carpeta ilegible o que desapareció: se deja como está (igual que os.walk, que las omitía)
+            return False
+        if not empty:
+            return False
+        try:
+            os.rmdir(d)
+        except OSError:
+            # Si no está vacío por algún motivo, ignorar
+            return False
+        log.info("[RMDIR] %s", os.path.relpath(d, input_root))
+        removed += 1
+        return True
+
+    try:
+        with os.scandir(input_root) as it:
+            subdirs = [e.path for e in it if e.is_dir(follow_symlinks=False)]
+    except OSError:
+        return 0
+    for d in subdirs:
+        _clean(d)
     return removed
 
 
@@ -79,13 +108,14 @@ def parse_args():
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     args = parse_args()
     input_root = Path(args.input_dir)
 
     moved = move_excels_to_root(input_root)
     removed = remove_empty_dirs(input_root)
 
-    print(f"[RESUMEN] Movidos: {moved} .xlsx | Directorios eliminados: {removed}")
+    log.info("[RESUMEN] Movidos: %s .xlsx | Directorios eliminados: %s", moved, removed)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,24 @@
 import argparse
 import json
+import math
+import multiprocessing
+import os
+import posixpath
 import re
+import threading
 import unicodedata
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, DefaultDict, Dict, Iterator, List, Optional, Tuple
 
+import openpyxl.reader.excel as _oxl_excel  # type: ignore
 from openpyxl import load_workbook
+from openpyxl.styles.stylesheet import apply_stylesheet as _oxl_apply_stylesheet
 # Evitar el parseo de dibujos/imágenes de openpyxl que puede ser muy costoso y provocar bloqueos
 try:
 	import openpyxl.reader.drawings as _oxl_drawings  # type: ignore
@@ -20,12 +33,51 @@ try:
 except Exception:
 	# Si por alguna razón falla, continuamos sin el parche.
 	pass
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
 from openpyxl.utils import column_index_from_string
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar
+try:
+	import orjson  # type: ignore
+except ImportError:
+	orjson = None  # type: ignore
+
+# python-calamine (lector en Rust) es opcional: habilita --lector calamine
+try:
+	from python_calamine import CalamineWorkbook  # type: ignore
+except ImportError:
+	CalamineWorkbook = None  # type: ignore
+
+# Versión del formato de datos extraídos. Incrementar al cambiar la lógica de extracción para que
+# los cachés que guardan resultados (p. ej. el de run_all) dejen de reutilizar datos anteriores
+VERSION_EXTRACCION = 1
+
+# Respaldo sin orjson: mismo formato que json.dump(..., ensure_ascii=False, indent=2)
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2)
+# Buffer de 1 MiB para escribir cada JSON con la menor cantidad de write()
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Patrones compilados una sola vez (antes se resolvían por la caché de re en cada llamada)
+_DIGIT_RE = re.compile(r"\d")
+_SHEET_NAME_SEP_RE = re.compile(r"[\s\W_]+")
+
+# Serializa el reemplazo temporal de openpyxl.reader.excel.apply_stylesheet entre hilos
+_ESTILOS_LOCK = threading.Lock()
+
+# Textos de la plantilla ya normalizados (strip + upper)
+_HDR_TEXT = "LOCALIZACION Y/O ELEMENTO"
+_CODIGO_LABELS = frozenset({"CODIGO", "CÓDIGO"})
 
 
 def leer_cedula(ws_apu) -> int:
 	"""Lee la cédula desde la hoja 'APU' en la celda L6 y la convierte a entero."""
-	valor = ws_apu["L6"].value
+	# Lectura acotada a L6: en modo read_only ws["L6"] recorre la hoja celda a celda
+	fila = next(ws_apu.iter_rows(min_row=6, max_row=6, min_col=12, max_col=12, values_only=True), None)
+	return _cedula_a_int(fila[0] if fila else None)
+
+
+def _cedula_a_int(valor: Any) -> int:
 	if valor is None:
 		return 0
 	try:
@@ -35,15 +87,11 @@ def leer_cedula(ws_apu) -> int:
 		return 0
 
 
-def _to_str(v: Any) -> str:
-	return "" if v is None else str(v)
-
-
 def _normalize_sheet_name(name: Any) -> str:
 	s = "" if name is None else str(name)
 	s = unicodedata.normalize("NFKD", s)
 	s = "".join(ch for ch in s if not unicodedata.combining(ch))
-	s = re.sub(r"[\s\W_]+", "", s)
+	s = _SHEET_NAME_SEP_RE.sub("", s)
 	return s.lower()
 
 
@@ -51,28 +99,27 @@ def _categoria_from_id(id_val: Any) -> str:
 	"""Obtiene el código de categoría a partir del id (parte antes del punto). Ej: '14.1' -> '14'."""
 	if id_val is None:
 		return ""
+	if type(id_val) is int:
+		return str(id_val)
 	s = str(id_val)
-	# Normalizar notación de floats con coma si apareciera
-	s = s.replace(",", ".")
-	return s.split(".")[0]
-
-
-def _sum_safe(values: List[Any]) -> float:
-	total = 0.0
-	for v in values:
-		try:
-			if v is None or (isinstance(v, str) and v.strip() == ""):
-				continue
-			total += float(v)
-		except Exception:
-			# Si no es numérico, lo ignoramos en la suma
-			continue
-	return total
+	# Cortar en el primer separador decimal ('.' o ',') sin crear copias intermedias
+	i = s.find(".")
+	j = s.find(",")
+	if j != -1 and (i == -1 or j < i):
+		i = j
+	return s if i == -1 else s[:i]
 
 
 def _round2_if_number(v: Any) -> float:
 	"""Convierte a float y redondea a 2 decimales; si no es numérico devuelve 0.0."""
 
+	# Caso común con values_only: int/float nativos (bool queda fuera por la comparación de tipo)
+	tipo = type(v)
+	if tipo is float:
+		return round(v, 2) if v == v else 0.0
+	if tipo is int:
+		return round(float(v), 2)
+
 	if v is None:
 		return 0.0
 
@@ -97,65 +144,87 @@ def _round2_if_number(v: Any) -> float:
 	return round(num, 2)
 
 
-def _clean_discounts_in_details(details: List[Dict[str, Any]]) -> None:
-	"""Filtra descuentos conservando solo aquellos con algún valor numérico positivo (> 0).
-	Si no queda ninguno, elimina la clave 'discounts' del quantity_detail.
+def _detalle_desde_fila(valores: Tuple[Any, ...]) -> Tuple[Dict[str, Any], float]:
+	"""Arma el quantity_detail de una fila F..S (14 valores) y devuelve (detalle, total).
+
+	Es la única conversión de la fila a dicts: redondea, detecta descuentos positivos y deja todos
+	los numéricos en float en una sola pasada, así que el detalle sale listo para exportar (sin
+	nulos que completar ni descuentos vacíos que filtrar después).
 	"""
-	NULL_KEYS = ["height", "width", "length", "area", "quantity", "subtotal"]
+	# Redondear las 13 columnas numéricas de la fila en un solo map()
+	(
+		height, width, length, area, quantity, subtotal,
+		d_height, d_width, d_length, d_area, d_quantity, d_subtotal, total_val,
+	) = map(_round2_if_number, valores[1:])
+
+	detalle: Dict[str, Any] = {
+		"location": valores[0],
+		"height": height,
+		"width": width,
+		"length": length,
+		"area": area,
+		"quantity": quantity,
+		"subtotal": subtotal,
+		"total": {"total": total_val},
+	}
+	# El descuento solo se arma si tiene algún valor positivo (los valores ya son float redondeados)
+	if d_height > 0 or d_width > 0 or d_length > 0 or d_area > 0 or d_quantity > 0 or d_subtotal > 0:
+		detalle["discounts"] = [
+			{
+				"element": "",
+				"height": d_height,
+				"width": d_width,
+				"length": d_length,
+				"area": d_area,
+				"quantity": d_quantity,
+				"subtotal": d_subtotal,
+			}
+		]
+	return detalle, total_val
 
-	def _has_positive_number(disc: Dict[str, Any]) -> bool:
-		for k in NULL_KEYS:
-			v = disc.get(k)
-			try:
-				if v is None or (isinstance(v, str) and v.strip() == ""):
-					continue
-				if float(v) > 0:
-					return True
-			except Exception:
-				continue
-		return False
 
-	for d in details:
-		discounts = d.get("discounts")
-		if not discounts:
-			d.pop("discounts", None)
+def _es_fila_vacia(valores: Tuple[Any, ...]) -> bool:
+	"""True si todas las celdas de la fila están vacías (None o texto en blanco)."""
+	for val in valores:
+		if val is None:
 			continue
-		filtered = []
-		for disc in discounts:
-			if _has_positive_number(disc):
-				filtered.append(disc)
-		if filtered:
-			d["discounts"] = filtered
-		else:
-			d.pop("discounts", None)
-
-
-def _zero_nulls_in_details(details: List[Dict[str, Any]]) -> None:
-	"""Convierte valores nulos en 0.0 para los campos numéricos de cada detail y sus discounts."""
-	NUM_KEYS = ["height", "width", "length", "area", "quantity", "subtotal"]
-	for d in details:
-		for k in NUM_KEYS:
-			val = d.get(k)
-			if val is None or (isinstance(val, str) and val.strip() == ""):
-				d[k] = 0.0
-		# total.total
-		total_obj = d.get("total")
-		if isinstance(total_obj, dict):
-			total_val = total_obj.get("total")
-			if total_val is None or (isinstance(total_val, str) and total_val.strip() == ""):
-				total_obj["total"] = 0.0
-		# discounts
-		discounts = d.get("discounts")
-		if discounts:
-			for disc in discounts:
-				for k in NUM_KEYS:
-					val = disc.get(k)
-					if val is None or (isinstance(val, str) and val.strip() == ""):
-						disc[k] = 0.0
-
-
-def extraer_datos_hoja(
-	ws,
+		if isinstance(val, str):
+			if val.strip():
+				return False
+			continue
+		return False
+	return True
+
+
+def _normalize(s: Any) -> str:
+	return "" if s is None else str(s).strip().upper()
+
+
+def _is_codigo_label(val: Any) -> bool:
+	return _normalize(val) in _CODIGO_LABELS
+
+
+def _looks_like_code(val: Any) -> bool:
+	if val is None:
+		return False
+	return _DIGIT_RE.search(str(val)) is not None
+
+
+def extraer_datos_hoja(ws, **kwargs: Any) -> List[Tuple[str, Dict[str, Any]]]:
+	"""Extrae las subcategorías de una hoja de openpyxl (ver extraer_datos_grid)."""
+	# En read_only openpyxl recorta las filas a la <dimension> declarada en el XML, que algunos
+	# generadores dejan desactualizada (p. ej. "A1"); descartarla hace que se lean todas las celdas
+	# reales, igual que en los lectores xml y calamine.
+	reset_dimensions = getattr(ws, "reset_dimensions", None)
+	if reset_dimensions is not None:
+		reset_dimensions()
+	# Materializar los valores de la hoja en una sola pasada: con el libro en read_only cada
+	# ws.cell()/ws["A1"] volvería a recorrer el XML, así que todo acceso posterior va a la grilla.
+	return extraer_datos_grid(list(ws.iter_rows(values_only=True)), **kwargs)
+
+
+def extraer_datos_grid(
+	grid: List[Tuple[Any, ...]],
 	*,
 	letra_celda_codigo: str = "B",
 	numero_celda_codigo: int = 9,
@@ -164,13 +233,14 @@ def extraer_datos_hoja(
 	letra_celda_fin_elementos: str = "S",
 	numero_celda_fin_elementos: int = 27,
 	steps: int = 33,
-) -> List[Dict[str, Any]]:
+) -> List[Tuple[str, Dict[str, Any]]]:
 	"""
-	Recorre la hoja para extraer subcategorías con sus quantity_details.
+	Recorre la hoja (como grilla de filas de valores, fila 1 = grid[0]) para extraer subcategorías
+	con sus quantity_details.
 
-	Devuelve una lista de dicts con forma:
+	Devuelve una lista de tuplas (codigo, subcategoría), donde codigo se deriva del id (parte antes
+	del punto, ej. "14") y la subcategoría tiene forma:
 	{
-	  "codigo": "14",            # derivado de id (parte antes del punto)
 	  "id": "14.1",              # valor leído en B9 (+ n*steps)
 	  "total_quantity": 123.0,     # suma de S[row] en el bloque
 	  "quantity_details": [        # filas de F..S
@@ -187,38 +257,56 @@ def extraer_datos_hoja(
 	elem_c2 = letra_celda_fin_elementos.upper()
 
 	# índices de columnas para validación de rango (no imprescindibles, pero útiles si iteramos)
-	column_index_from_string(elem_c1)
+	cod_idx = column_index_from_string(cod_col)
+	elem_idx1 = column_index_from_string(elem_c1)
 	column_index_from_string(elem_c2)
 
-	def _normalize(s: Any) -> str:
-		return "" if s is None else str(s).strip().upper()
+	max_row = len(grid)
 
-	def _is_codigo_label(val: Any) -> bool:
-		lbl = _normalize(val)
-		return lbl in ("CODIGO", "CÓDIGO")
+	def _celda(row: int, col: int) -> Any:
+		if row < 1 or row > max_row:
+			return None
+		fila = grid[row - 1]
+		return fila[col - 1] if 0 < col <= len(fila) else None
+
+	fila_vacia = (None,) * 14
+
+	def _valores_fila(row: int, base_col: int) -> Tuple[Any, ...]:
+		# Los 14 valores F..S de una fila (relativos a base_col) en un solo slice de la grilla
+		if row < 1 or row > max_row:
+			return fila_vacia
+		valores = grid[row - 1][base_col - 1:base_col + 13]
+		return valores if len(valores) == 14 else tuple(valores) + (None,) * (14 - len(valores))
+
+	_r2 = _round2_if_number
 
 	# 1) Detectar encabezados "LOCALIZACION Y/O ELEMENTO" y su columna
 	header_cells: List[tuple[int, int]] = []  # (row, col)
-	header_text = "LOCALIZACION Y/O ELEMENTO"
-	max_row = ws.max_row or 0
-	max_col = ws.max_column or 0
-	for r in range(1, max_row + 1):
-		for c in range(1, max_col + 1):
-			v = ws.cell(row=r, column=c).value
-			if _normalize(v) == header_text:
-				header_cells.append((r, c))
+	# Por fila se toma la primera coincidencia de izquierda a derecha. En la plantilla el título va en
+	# la columna de inicio de elementos (F): si está ahí basta revisar las celdas a su izquierda; si
+	# no, se recorre esa fila completa (un bloque corrido a otra columna no se pierde aunque los
+	# demás sí estén en F). Solo un texto puede ser el título, sin pasar por str()
+	elem_pos = elem_idx1 - 1
+	largo_titulo = len(_HDR_TEXT)
+
+	def _es_titulo(v: Any) -> bool:
+		return isinstance(v, str) and len(v) >= largo_titulo and v.strip().upper() == _HDR_TEXT
+
+	for r, fila in enumerate(grid, start=1):
+		if len(fila) > elem_pos and _es_titulo(fila[elem_pos]):
+			celdas = fila[:elem_pos]
+			encontrado = elem_idx1
+		else:
+			celdas = fila
+			encontrado = 0
+		for c, v in enumerate(celdas, start=1):
+			if _es_titulo(v):
+				encontrado = c
 				break  # asumir una coincidencia por fila es suficiente
+		if encontrado:
+			header_cells.append((r, encontrado))
 
-	subcategorias: List[Dict[str, Any]] = []
-
-	def _row_is_empty(row: int) -> bool:
-		# Considerar vacío si todas las celdas F..S están vacías o string vacío
-		for col in ["F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S"]:
-			val = ws[f"{col}{row}"].value
-			if val not in (None, ""):
-				if not (isinstance(val, str) and val.strip() == ""):
-					return False
-		return True
+	subcategorias: List[Tuple[str, Dict[str, Any]]] = []
 
 	if header_cells:
 		header_cells.sort(key=lambda t: (t[0], t[1]))
@@ -233,41 +321,27 @@ def extraer_datos_hoja(
 				end_row = min(end_row, next_hr - 1)
 			end_row = min(end_row, max_row)
 
-			# Ajustar end_row para no pasarnos por filas completamente vacías al final
-			def _row_is_empty_rel(row: int, base_col: int) -> bool:
-				# Considerar vacío si todas las celdas desde base_col hasta base_col+13 están vacías
-				for offset in range(0, 14):  # columnas F..S relativo al encabezado
-					col_idx = base_col + offset
-					val = ws.cell(row=row, column=col_idx).value
-					if val not in (None, ""):
-						if not (isinstance(val, str) and str(val).strip() == ""):
-							return False
-				return True
-
-			r = end_row
-			while r >= start_row and _row_is_empty_rel(r, hc):
-				r -= 1
-			end_row = r
-
-			if end_row < start_row:
+			# Leer una sola vez las filas del bloque (F..S relativas al encabezado, base = hc) y marcar
+			# cuáles están completamente vacías; la máscara recorta el final y salta las del medio
+			filas = [_valores_fila(r, hc) for r in range(start_row, end_row + 1)]
+			vacias = [_es_fila_vacia(valores) for valores in filas]
+			n_filas = len(filas)
+			while n_filas and vacias[n_filas - 1]:
+				n_filas -= 1
+
+			if not n_filas:
 				continue  # no hay detalles
 
 			# Buscar id priorizando columna B hacia arriba con preferencia por valores con dígitos,
 			# y validando que arriba del id esté la etiqueta 'CODIGO'/'CÓDIGO'.
-			def _looks_like_code(val: Any) -> bool:
-				if val is None:
-					return False
-				s = str(val)
-				return bool(re.search(r"\d", s))
-
 			id_val = None
 			id_pos = None  # (row, col)
 			# 1) Columna B (2)
 			probe_row = hr - 1
 			while probe_row >= 1 and (hr - probe_row) <= 30:
-				candidate = ws.cell(row=probe_row, column=2).value
-				if candidate not in (None, "") and not (isinstance(candidate, str) and str(candidate).strip() == ""):
-					if _looks_like_code(candidate) and _is_codigo_label(ws.cell(row=probe_row - 1, column=2).value):
+				candidate = _celda(probe_row, 2)
+				if candidate is not None and not (isinstance(candidate, str) and not candidate.strip()):
+					if _looks_like_code(candidate) and _is_codigo_label(_celda(probe_row - 1, 2)):
 						id_val = candidate
 						id_pos = (probe_row, 2)
 						break
@@ -278,9 +352,9 @@ def extraer_datos_hoja(
 				id_col = max(1, hc - 2)
 				probe_row = hr - 1
 				while probe_row >= 1 and (hr - probe_row) <= 30:
-					candidate = ws.cell(row=probe_row, column=id_col).value
-					if candidate not in (None, "") and not (isinstance(candidate, str) and str(candidate).strip() == ""):
-						if _looks_like_code(candidate) and _is_codigo_label(ws.cell(row=probe_row - 1, column=id_col).value):
+					candidate = _celda(probe_row, id_col)
+					if candidate is not None and not (isinstance(candidate, str) and not candidate.strip()):
+						if _looks_like_code(candidate) and _is_codigo_label(_celda(probe_row - 1, id_col)):
 							id_val = candidate
 							id_pos = (probe_row, id_col)
 							break
@@ -291,85 +365,46 @@ def extraer_datos_hoja(
 				continue
 
 			details = []
-			totals_collected: List[Any] = []
-			for row in range(start_row, end_row + 1):
+			# Los totales ya salen de _detalle_desde_fila como float: se suman directo con fsum, sin volver a coercionarlos
+			totals_collected: List[float] = []
+			for i in range(n_filas):
 				# Omitir filas completamente vacías en el medio
-				if _row_is_empty_rel(row, hc):
+				if vacias[i]:
 					continue
+				valores = filas[i]
 
-				# Columnas relativas al encabezado: base = hc
-				base = hc
-				location = ws.cell(row=row, column=base + 0).value
+				location = valores[0]
 				# Filtrar: incluir solo si location tiene valor
 				if location is None or (isinstance(location, str) and str(location).strip() == ""):
 					continue
 
-				height = _round2_if_number(ws.cell(row=row, column=base + 1).value)
-				width = _round2_if_number(ws.cell(row=row, column=base + 2).value)
-				length = _round2_if_number(ws.cell(row=row, column=base + 3).value)
-				area = _round2_if_number(ws.cell(row=row, column=base + 4).value)
-				quantity = _round2_if_number(ws.cell(row=row, column=base + 5).value)
-				subtotal = _round2_if_number(ws.cell(row=row, column=base + 6).value)
-
-				d_height = _round2_if_number(ws.cell(row=row, column=base + 7).value)
-				d_width = _round2_if_number(ws.cell(row=row, column=base + 8).value)
-				d_length = _round2_if_number(ws.cell(row=row, column=base + 9).value)
-				d_area = _round2_if_number(ws.cell(row=row, column=base + 10).value)
-				d_quantity = _round2_if_number(ws.cell(row=row, column=base + 11).value)
-				d_subtotal = _round2_if_number(ws.cell(row=row, column=base + 12).value)
-
-				total_val = _round2_if_number(ws.cell(row=row, column=base + 13).value)
+				detalle, total_val = _detalle_desde_fila(valores)
 				totals_collected.append(total_val)
+				details.append(detalle)
 
-				details.append(
-					{
-						"location": location,
-						"height": height,
-						"width": width,
-						"length": length,
-						"area": area,
-						"quantity": quantity,
-						"subtotal": subtotal,
-						"total": {"total": total_val},
-						"discounts": [
-							{
-								"element": "",
-								"height": d_height,
-								"width": d_width,
-								"length": d_length,
-								"area": d_area,
-								"quantity": d_quantity,
-								"subtotal": d_subtotal,
-							}
-						],
-					}
-				)
-
-			# Limpiar descuentos vacíos y armar subcategoría; omitir total_quantity si no hay código numérico
+			# Armar subcategoría; omitir total_quantity si no hay código numérico
 			codigo_cat = _categoria_from_id(id_val)
 			has_numeric_code = any(ch.isdigit() for ch in str(id_val))
-			_clean_discounts_in_details(details)
-			_zero_nulls_in_details(details)
 			subcat = {
-				"codigo": codigo_cat,
 				"id": id_val,
 				"quantity_details": details,
 			}
 			if has_numeric_code:
-				subcat["total_quantity"] = _round2_if_number(_sum_safe(totals_collected))
+				subcat["total_quantity"] = _r2(math.fsum(totals_collected))
 			# Agregar solo si hay detalles
 			if details:
-				subcategorias.append(subcat)
+				subcategorias.append((codigo_cat, subcat))
 
 		return subcategorias
 
 	# 2) Fallback: método por pasos (si no se halló el encabezado)
 	subcategorias = []
+	elem_base = elem_idx1 - 1
+	elem_fin = elem_base + 14
 	i = 0
 	while True:
 		code_row = numero_celda_codigo + i * steps
-		code_cell = f"{cod_col}{code_row}"
-		id_val = ws[code_cell].value
+		id_val = _celda(code_row, cod_idx)
 
 		if id_val is None or (isinstance(id_val, str) and id_val.strip() == ""):
 			break
@@ -377,7 +412,7 @@ def extraer_datos_hoja(
 		# Validar que sobre el ID esté la etiqueta CODIGO/CÓDIGO en la misma columna del código
 		label_row = code_row - 1
 		if label_row >= 1:
-			if not _is_codigo_label(ws[f"{cod_col}{label_row}"].value):
+			if not _is_codigo_label(_celda(label_row, cod_idx)):
 				i += 1
 				continue
 
@@ -386,104 +421,47 @@ def extraer_datos_hoja(
 
 		details = []
 		totals_collected = []
-		for row in range(r1, r2 + 1):
-			location = ws[f"F{row}"].value
+		# Recortar el bloque de filas una sola vez y tomar F..S de cada fila con un slice; las filas
+		# fuera de la hoja no aportan detalles, así que basta con acotar el rango a la grilla.
+		for fila in grid[max(r1, 1) - 1:r2]:
+			valores = fila[elem_base:elem_fin]
+			if not valores:
+				continue
+			location = valores[0]
 			if location is None or (isinstance(location, str) and location.strip() == ""):
 				continue
-			height = _round2_if_number(ws[f"G{row}"].value)
-			width = _round2_if_number(ws[f"H{row}"].value)
-			length = _round2_if_number(ws[f"I{row}"].value)
-			area = _round2_if_number(ws[f"J{row}"].value)
-			quantity = _round2_if_number(ws[f"K{row}"].value)
-			subtotal = _round2_if_number(ws[f"L{row}"].value)
-
-			d_height = _round2_if_number(ws[f"M{row}"].value)
-			d_width = _round2_if_number(ws[f"N{row}"].value)
-			d_length = _round2_if_number(ws[f"O{row}"].value)
-			d_area = _round2_if_number(ws[f"P{row}"].value)
-			d_quantity = _round2_if_number(ws[f"Q{row}"].value)
-			d_subtotal = _round2_if_number(ws[f"R{row}"].value)
-
-			total_val = _round2_if_number(ws[f"S{row}"].value)
+			if len(valores) < 14:
+				valores = tuple(valores) + (None,) * (14 - len(valores))
+			detalle, total_val = _detalle_desde_fila(valores)
 			totals_collected.append(total_val)
-
-			details.append(
-				{
-					"location": location,
-					"height": height,
-					"width": width,
-					"length": length,
-					"area": area,
-					"quantity": quantity,
-					"subtotal": subtotal,
-					"total": {"total": total_val},
-					"discounts": [
-						{
-							"element": "",
-							"height": d_height,
-							"width": d_width,
-							"length": d_length,
-							"area": d_area,
-							"quantity": d_quantity,
-							"subtotal": d_subtotal,
-						}
-					],
-				}
-			)
+			details.append(detalle)
 
 		codigo_cat = _categoria_from_id(id_val)
 		has_numeric_code = any(ch.isdigit() for ch in str(id_val))
-		_clean_discounts_in_details(details)
-		_zero_nulls_in_details(details)
 		subcat = {
-			"codigo": codigo_cat,
 			"id": id_val,
 			"quantity_details": details,
 		}
 		if has_numeric_code:
-			subcat["total_quantity"] = _round2_if_number(_sum_safe(totals_collected))
+			subcat["total_quantity"] = _r2(math.fsum(totals_collected))
 		# Agregar solo si hay detalles
 		if details:
-			subcategorias.append(subcat)
+			subcategorias.append((codigo_cat, subcat))
 
 		i += 1
 
 	return subcategorias
 
 
-def procesar_archivo(
-	xlsx_path: Path,
-	*,
-	letra_celda_codigo: str,
-	numero_celda_codigo: int,
-	letra_celda_inicio_elementos: str,
-	numero_celda_inicio_elementos: int,
-	letra_celda_fin_elementos: str,
-	numero_celda_fin_elementos: int,
-	steps: int,
-) -> Optional[Dict[str, Any]]:
-	"""Procesa un archivo .xlsx y devuelve un dict listo para exportar a JSON.
-
-	Estructura devuelta:
-	{
-	  "archivo": nombre_base.xlsx,
-	  "cedula": valor_de_APU_L6,
-	  "datos": [ {"codigo": ..., "elementos": [[...], ...]}, ... ]
-	}
-	"""
-	try:
-		# Abrir sin read_only para evitar el streaming lento al acceder celdas arbitrarias;
-		# mantener data_only y keep_links=False para rendimiento
-		wb = load_workbook(filename=str(xlsx_path), data_only=True, keep_links=False)
-	except Exception as exc:
-		print(f"[ERROR] No se pudo abrir '{xlsx_path.name}': {exc}")
-		return None
+def _seleccionar_hojas(sheet_names: List[str], nombre_archivo: str) -> Optional[Tuple[str, str]]:
+	"""Devuelve (hoja APU, hoja de cantidades) o None si el libro no tiene las hojas esperadas."""
+	# Normalizar cada nombre una sola vez; ambas búsquedas trabajan sobre esta lista.
+	normalizados = [_normalize_sheet_name(sheet_name) for sheet_name in sheet_names]
 
 	# Localizar la hoja "APU" tolerando variaciones de mayúsculas, espacios o caracteres extra.
-	sheet_names = list(wb.sheetnames)
 	apu_index: Optional[int] = None
-	for idx, sheet_name in enumerate(sheet_names):
-		if "apu" in _normalize_sheet_name(sheet_name):
+	for idx, norm_name in enumerate(normalizados):
+		if "apu" in norm_name:
 			apu_index = idx
 			break
 
@@ -492,73 +470,58 @@ def procesar_archivo(
 			apu_index = 1
 			target_apu_name = sheet_names[apu_index]
 			print(
-				f"[ADVERTENCIA] Hoja tipo 'APU' no encontrada por nombre exacto en '{xlsx_path.name}'. "
+				f"[ADVERTENCIA] Hoja tipo 'APU' no encontrada por nombre exacto en '{nombre_archivo}'. "
 				f"Se asume '{target_apu_name}' (segunda hoja)."
 			)
 		elif sheet_names:
 			apu_index = 0
 			target_apu_name = sheet_names[apu_index]
 			print(
-				f"[ADVERTENCIA] Hoja tipo 'APU' no encontrada por nombre exacto en '{xlsx_path.name}'. "
+				f"[ADVERTENCIA] Hoja tipo 'APU' no encontrada por nombre exacto en '{nombre_archivo}'. "
 				f"Se asume '{target_apu_name}'."
 			)
 		else:
-			print(f"[ADVERTENCIA] El libro '{xlsx_path.name}' no contiene hojas. Se omite.")
+			print(f"[ADVERTENCIA] El libro '{nombre_archivo}' no contiene hojas. Se omite.")
 			return None
 	else:
 		target_apu_name = sheet_names[apu_index]
 
-	apu_ws = wb[target_apu_name]
-	cedula = leer_cedula(apu_ws)
-
 	# Seleccionar la hoja de cantidades: priorizar la que esté inmediatamente después de la APU,
 	# y como respaldo aceptar cualquier hoja cuyo nombre contenga "cant" y "beneficiario".
-	target_sheet_name: Optional[str] = None
-	if apu_index + 1 < len(sheet_names):
-		target_sheet_name = sheet_names[apu_index + 1]
+	def _es_hoja_cantidades(norm_name: str) -> bool:
+		return "cant" in norm_name and "beneficiario" in norm_name
 
-	for idx, sheet_name in enumerate(sheet_names):
-		norm_name = _normalize_sheet_name(sheet_name)
-		if "cant" in norm_name and "beneficiario" in norm_name:
-			target_sheet_name = sheet_name
-			if idx == apu_index + 1:
-				break
+	target_sheet_name: Optional[str] = None
+	siguiente = apu_index + 1
+	if siguiente < len(sheet_names):
+		# Caso común: la hoja siguiente a la APU; se resuelve por índice sin recorrer el resto
+		target_sheet_name = sheet_names[siguiente]
+		if _es_hoja_cantidades(normalizados[siguiente]):
+			return target_apu_name, target_sheet_name
+
+	# Si la siguiente no se llama "cant... beneficiario", gana la última hoja que sí lo haga
+	for idx in range(len(normalizados) - 1, -1, -1):
+		if _es_hoja_cantidades(normalizados[idx]):
+			target_sheet_name = sheet_names[idx]
+			break
 
 	if target_sheet_name is None:
 		print(
-			f"[ADVERTENCIA] No se encontró hoja de beneficiario cercana a '{target_apu_name}' en '{xlsx_path.name}'. Se omite."
+			f"[ADVERTENCIA] No se encontró hoja de beneficiario cercana a '{target_apu_name}' en '{nombre_archivo}'. Se omite."
 		)
 		return None
 
-	ws_target = wb[target_sheet_name]
-
-	subcats = extraer_datos_hoja(
-		ws_target,
-		letra_celda_codigo=letra_celda_codigo,
-		numero_celda_codigo=numero_celda_codigo,
-		letra_celda_inicio_elementos=letra_celda_inicio_elementos,
-		numero_celda_inicio_elementos=numero_celda_inicio_elementos,
-		letra_celda_fin_elementos=letra_celda_fin_elementos,
-		numero_celda_fin_elementos=numero_celda_fin_elementos,
-		steps=steps,
-	)
+	return target_apu_name, target_sheet_name
 
-	# Agrupar por categoría (codigo)
-	cats_map: Dict[str, Dict[str, Any]] = {}
-	for sc in subcats:
-		codigo_cat = _to_str(sc.get("codigo", ""))
-		if codigo_cat not in cats_map:
-			cats_map[codigo_cat] = {"codigo": codigo_cat, "subcategories": []}
-		# Subcategorías incluyen id, total_quantity y quantity_details
-		sub = {
-			"id": sc.get("id"),
-			"quantity_details": sc.get("quantity_details", []),
-		}
-		if "total_quantity" in sc:
-			sub["total_quantity"] = sc["total_quantity"]
-		cats_map[codigo_cat]["subcategories"].append(sub)
 
-	categories = list(cats_map.values())
+def _armar_resultado(cedula: int, subcats: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+	# Agrupar por categoría (codigo); las subcategorías ya vienen con id, quantity_details y
+	# total_quantity, así que se agregan tal cual. El orden de categorías es el de aparición.
+	cats_map: DefaultDict[str, List[Dict[str, Any]]] = defaultdict(list)
+	for codigo_cat, sub in subcats:
+		cats_map[codigo_cat].append(sub)
+
+	categories = [{"codigo": codigo_cat, "subcategories": subs} for codigo_cat, subs in cats_map.items()]
 
 	return {
 		"cedula": cedula,
@@ -566,32 +529,451 @@ def procesar_archivo(
 	}
 
 
+def procesar_archivo(
+	xlsx_path: Path,
+	*,
+	letra_celda_codigo: str,
+	numero_celda_codigo: int,
+	letra_celda_inicio_elementos: str,
+	numero_celda_inicio_elementos: int,
+	letra_celda_fin_elementos: str,
+	numero_celda_fin_elementos: int,
+	steps: int,
+) -> Optional[Dict[str, Any]]:
+	"""Procesa un archivo .xlsx y devuelve un dict listo para exportar a JSON.
+
+	Estructura devuelta:
+	{
+	  "archivo": nombre_base.xlsx,
+	  "cedula": valor_de_APU_L6,
+	  "datos": [ {"codigo": ..., "elementos": [[...], ...]}, ... ]
+	}
+	"""
+	# Solo se leen valores: sustituir temporalmente la carga completa de styles.xml (fuentes,
+	# rellenos, bordes, estilos con nombre) por una que indexa únicamente los formatos de fecha.
+	# El reemplazo es global al módulo de openpyxl: se hace bajo un lock y solo si ahí está la función
+	# original de openpyxl; si una versión futura la mueve o renombra, se carga con la estándar
+	try:
+		with _ESTILOS_LOCK:
+			parchear = getattr(_oxl_excel, "apply_stylesheet", None) is _oxl_apply_stylesheet
+			if parchear:
+				_oxl_excel.apply_stylesheet = _aplicar_solo_formatos_fecha
+			try:
+				# read_only: openpyxl parsea el XML bajo demanda y solo se leen la APU y la hoja de
+				# cantidades (el acceso aleatorio se resuelve sobre la grilla de extraer_datos_hoja)
+				wb = load_workbook(filename=str(xlsx_path), data_only=True, read_only=True, keep_vba=False, keep_links=False)
+			finally:
+				if parchear:
+					_oxl_excel.apply_stylesheet = _oxl_apply_stylesheet
+	except Exception as exc:
+		print(f"[ERROR] No se pudo abrir '{xlsx_path.name}': {exc}")
+		return None
+
+	try:
+		hojas = _seleccionar_hojas(wb.sheetnames, xlsx_path.name)
+		if hojas is None:
+			return None
+		target_apu_name, target_sheet_name = hojas
+
+		cedula = leer_cedula(wb[target_apu_name])
+		subcats = extraer_datos_hoja(
+			wb[target_sheet_name],
+			letra_celda_codigo=letra_celda_codigo,
+			numero_celda_codigo=numero_celda_codigo,
+			letra_celda_inicio_elementos=letra_celda_inicio_elementos,
+			numero_celda_inicio_elementos=numero_celda_inicio_elementos,
+			letra_celda_fin_elementos=letra_celda_fin_elementos,
+			numero_celda_fin_elementos=numero_celda_fin_elementos,
+			steps=steps,
+		)
+	finally:
+		# En read_only el libro mantiene abierto el archivo hasta cerrarlo explícitamente
+		wb.close()
+
+	return _armar_resultado(cedula, subcats)
+
+
+# --- Lector XML directo (sin openpyxl) ---------------------------------------------------------
+# Solo se necesitan valores de dos hojas, así que se leen las partes del .xlsx (zip) con
+# ElementTree.iterparse: sin construir estilos completos, objetos Cell ni el modelo del libro.
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_TAG_ROW = _NS_MAIN + "row"
+_TAG_C = _NS_MAIN + "c"
+_TAG_V = _NS_MAIN + "v"
+_TAG_T = _NS_MAIN + "t"
+_TAG_R = _NS_MAIN + "r"
+_TAG_IS = _NS_MAIN + "is"
+_TAG_SI = _NS_MAIN + "si"
+
+
+def _xml_rels(zf: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+	"""Relaciones de una parte del paquete: Id -> (Type, ruta absoluta dentro del zip)."""
+	base, nombre = posixpath.split(part)
+	rels_path = posixpath.join(base, "_rels", nombre + ".rels")
+	if rels_path not in zf.NameToInfo:
+		return {}
+	rels: Dict[str, Tuple[str, str]] = {}
+	for rel in ET.fromstring(zf.read(rels_path)).iter(_NS_PKG + "Relationship"):
+		target = rel.get("Target", "")
+		if target.startswith("/"):
+			target = target[1:]
+		else:
+			target = posixpath.normpath(posixpath.join(base, target))
+		rels[rel.get("Id", "")] = (rel.get("Type", ""), target)
+	return rels
+
+
+def _xml_texto(elem) -> str:
+	# Igual que openpyxl: texto plano <t> más los <r><t> de texto enriquecido (sin fonética <rPh>)
+	partes = []
+	for child in elem:
+		if child.tag == _TAG_T:
+			partes.append(child.text or "")
+		elif child.tag == _TAG_R:
+			t = child.find(_TAG_T)
+			if t is not None:
+				partes.append(t.text or "")
+	return "".join(partes)
+
+
+def _xml_shared_strings(zf: zipfile.ZipFile, part: Optional[str]) -> List[str]:
+	if not part:
+		return []
+	strings: List[str] = []
+	for _, elem in ET.iterparse(zf.open(part)):
+		if elem.tag == _TAG_SI:
+			strings.append(_xml_texto(elem).replace("x005F_", ""))
+			elem.clear()
+	return strings
+
+
+def _xml_estilos_fecha(zf: zipfile.ZipFile, part: Optional[str]) -> Tuple[set, set]:
+	"""Índices de estilo (atributo s de <c>) con formato de fecha y de duración."""
+	fechas: set = set()
+	duraciones: set = set()
+	if not part:
+		return fechas, duraciones
+	root = ET.fromstring(zf.read(part))
+	custom: Dict[int, str] = {}
+	num_fmts = root.find(_NS_MAIN + "numFmts")
+	if num_fmts is not None:
+		for nf in num_fmts:
+			custom[int(nf.get("numFmtId", "0"))] = nf.get("formatCode", "")
+	cell_xfs = root.find(_NS_MAIN + "cellXfs")
+	if cell_xfs is not None:
+		for idx, xf in enumerate(cell_xfs):
+			fmt_id = int(xf.get("numFmtId", "0"))
+			fmt = custom.get(fmt_id) or builtin_format_code(fmt_id)
+			if fmt and is_date_format(fmt):
+				fechas.add(idx)
+			if fmt and is_timedelta_format(fmt):
+				duraciones.add(idx)
+	return fechas, duraciones
+
+
+def _aplicar_solo_formatos_fecha(archive: zipfile.ZipFile, wb) -> Any:
+	"""Reemplazo de openpyxl.reader.excel.apply_stylesheet para leer solo valores.
+
+	openpyxl necesita saber qué estilos son fechas para convertir los seriales a datetime; el resto
+	de la hoja de estilos no se usa aquí.
+	"""
+	# Depende de atributos privados del Workbook (probado con openpyxl 3.1): si no existen, usar la
+	# carga estándar de estilos en lugar de inventarlos
+	if not (hasattr(wb, "_date_formats") and hasattr(wb, "_timedelta_formats")):
+		return _oxl_apply_stylesheet(archive, wb)
+	part = "xl/styles.xml" if "xl/styles.xml" in archive.NameToInfo else None
+	wb._date_formats, wb._timedelta_formats = _xml_estilos_fecha(archive, part)
+	return wb
+
+
+def _xml_leer_grid(
+	zf: zipfile.ZipFile,
+	part: str,
+	shared: List[str],
+	fechas: set,
+	duraciones: set,
+	epoch,
+	*,
+	hasta_fila: Optional[int] = None,
+) -> List[Tuple[Any, ...]]:
+	"""Lee los valores de una hoja como grilla (misma forma que iter_rows(values_only=True))."""
+	filas: List[List[Any]] = []
+	row_counter = 0
+	for _, elem in ET.iterparse(zf.open(part)):
+		if elem.tag != _TAG_ROW:
+			continue
+		r_attr = elem.get("r")
+		row_counter = int(r_attr) if r_attr else row_counter + 1
+		if hasta_fila is not None and row_counter > hasta_fila:
+			break
+		while len(filas) < row_counter:
+			filas.append([])
+		fila = filas[row_counter - 1]
+		col = 0
+		for c in elem.iter(_TAG_C):
+			ref = c.get("r")
+			if ref:
+				letras = ref.rstrip("0123456789")
+				col = column_index_from_string(letras)
+			else:
+				col += 1
+			t = c.get("t", "n")
+			if t == "inlineStr":
+				is_elem = c.find(_TAG_IS)
+				value: Any = _xml_texto(is_elem) if is_elem is not None else None
+			else:
+				value = c.findtext(_TAG_V) or None
+				if value is not None:
+					if t == "n":
+						value = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+						style = int(c.get("s", "0"))
+						if style in fechas:
+							try:
+								value = from_excel(value, epoch, timedelta=style in duraciones)
+							except (OverflowError, ValueError):
+								value = "#VALUE!"
+					elif t == "s":
+						value = shared[int(value)]
+					elif t == "b":
+						value = bool(int(value))
+					elif t == "d":
+						value = from_ISO8601(value)
+			if value is None:
+				continue
+			if len(fila) < col:
+				fila.extend([None] * (col - len(fila)))
+			fila[col - 1] = value
+		elem.clear()
+	return [tuple(f) for f in filas]
+
+
+def procesar_archivo_xml(xlsx_path: Path, **kwargs: Any) -> Optional[Dict[str, Any]]:
+	"""Variante de procesar_archivo que lee el .xlsx directamente (zip + XML) sin openpyxl.
+
+	Recibe los mismos parámetros y devuelve la misma estructura; sirve para lotes grandes donde el
+	costo de load_workbook domina.
+	"""
+	try:
+		zf = zipfile.ZipFile(xlsx_path)
+	except Exception as exc:
+		print(f"[ERROR] No se pudo abrir '{xlsx_path.name}': {exc}")
+		return None
+
+	with zf:
+		# Parte principal del libro según _rels/.rels (normalmente xl/workbook.xml)
+		wb_part = next(
+			(target for typ, target in _xml_rels(zf, "").values() if typ.endswith("/officeDocument")),
+			"xl/workbook.xml",
+		)
+		wb_root = ET.fromstring(zf.read(wb_part))
+		wb_rels = _xml_rels(zf, wb_part)
+
+		sheet_names: List[str] = []
+		sheet_parts: Dict[str, str] = {}
+		for sheet in wb_root.iter(_NS_MAIN + "sheet"):
+			name = sheet.get("name", "")
+			sheet_names.append(name)
+			rel = wb_rels.get(sheet.get(_NS_R + "id", ""))
+			if rel:
+				sheet_parts[name] = rel[1]
+
+		hojas = _seleccionar_hojas(sheet_names, xlsx_path.name)
+		if hojas is None:
+			return None
+		target_apu_name, target_sheet_name = hojas
+
+		wb_pr = wb_root.find(_NS_MAIN + "workbookPr")
+		date1904 = wb_pr is not None and wb_pr.get("date1904", "").lower() in ("1", "true")
+		epoch = MAC_EPOCH if date1904 else WINDOWS_EPOCH
+
+		parts_por_tipo = {typ.rsplit("/", 1)[-1]: target for typ, target in wb_rels.values()}
+		shared = _xml_shared_strings(zf, parts_por_tipo.get("sharedStrings"))
+		fechas, duraciones = _xml_estilos_fecha(zf, parts_por_tipo.get("styles"))
+
+		apu_part = sheet_parts.get(target_apu_name)
+		cedula = 0
+		if apu_part:
+			grid_apu = _xml_leer_grid(zf, apu_part, shared, fechas, duraciones, epoch, hasta_fila=6)
+			fila6 = grid_apu[5] if len(grid_apu) >= 6 else ()
+			cedula = _cedula_a_int(fila6[11] if len(fila6) >= 12 else None)
+
+		target_part = sheet_parts.get(target_sheet_name)
+		grid = _xml_leer_grid(zf, target_part, shared, fechas, duraciones, epoch) if target_part else []
+
+	subcats = extraer_datos_grid(grid, **kwargs)
+	return _armar_resultado(cedula, subcats)
+
+
+def _valor_calamine(v: Any) -> Any:
+	# calamine entrega "" en celdas vacías, float en enteros y date en fechas sin hora; se
+	# normaliza a lo que devuelve openpyxl (None, int, datetime) para que el JSON resulte idéntico
+	tipo = type(v)
+	if tipo is str:
+		return None if v == "" else v
+	if tipo is float:
+		return int(v) if v.is_integer() else v
+	if tipo is date:
+		return datetime(v.year, v.month, v.day)
+	return v
+
+
+def _grid_calamine(filas: List[List[Any]]) -> List[Tuple[Any, ...]]:
+	return [tuple(map(_valor_calamine, fila)) for fila in filas]
+
+
+def procesar_archivo_calamine(xlsx_path: Path, **kwargs: Any) -> Optional[Dict[str, Any]]:
+	"""Variante de procesar_archivo con python-calamine; mismos parámetros y misma estructura."""
+	try:
+		wb = CalamineWorkbook.from_path(str(xlsx_path))
+	except Exception as exc:
+		print(f"[ERROR] No se pudo abrir '{xlsx_path.name}': {exc}")
+		return None
+
+	try:
+		hojas = _seleccionar_hojas(list(wb.sheet_names), xlsx_path.name)
+		if hojas is None:
+			return None
+		target_apu_name, target_sheet_name = hojas
+
+		# skip_empty_area=False conserva las filas/columnas vacías iniciales (índices = coordenadas)
+		apu = wb.get_sheet_by_name(target_apu_name).to_python(skip_empty_area=False, nrows=6)
+		fila6 = apu[5] if len(apu) >= 6 else []
+		cedula = _cedula_a_int(_valor_calamine(fila6[11]) if len(fila6) >= 12 else None)
+
+		grid = _grid_calamine(wb.get_sheet_by_name(target_sheet_name).to_python(skip_empty_area=False))
+	finally:
+		wb.close()
+
+	return _armar_resultado(cedula, extraer_datos_grid(grid, **kwargs))
+
+
+def procesar_archivos(
+	excels: List[Path],
+	*,
+	workers: int = 1,
+	lector: str = "openpyxl",
+	**kwargs: Any,
+) -> Iterator[Tuple[Path, Optional[Dict[str, Any]]]]:
+	"""Procesa varios .xlsx (en paralelo si workers > 1) y entrega (ruta, datos) en el orden de entrada.
+
+	Cada libro es independiente, así que se reparte en un pool de procesos (el parseo de openpyxl
+	es CPU-bound). Mantener el orden permite asignar los consecutivos en el proceso principal.
+	"""
+	if lector == "calamine" and CalamineWorkbook is None:
+		print("[ADVERTENCIA] python-calamine no está instalado; se usa openpyxl.")
+		lector = "openpyxl"
+	funcion = {"xml": procesar_archivo_xml, "calamine": procesar_archivo_calamine}.get(lector, procesar_archivo)
+	tarea = partial(funcion, **kwargs)
+	workers = min(workers, len(excels))
+	if workers <= 1:
+		for xlsx in excels:
+			yield xlsx, tarea(xlsx)
+		return
+	# Con otros hilos vivos (p. ej. las consultas en segundo plano de run_all) no es seguro hacer fork:
+	# el hijo podría heredar locks tomados (logging, SSL, pool de urllib3). En ese caso se usa spawn;
+	# si el proceso tiene un solo hilo se deja el contexto por defecto del sistema
+	mp_context = multiprocessing.get_context("spawn") if threading.active_count() > 1 else None
+	with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as ex:
+		yield from zip(excels, ex.map(tarea, excels))
+
+
 def siguiente_consecutivo(output_dir: Path) -> int:
 	"""Calcula el siguiente consecutivo basado en archivos N.json existentes."""
 	max_n = 0
-	for p in output_dir.glob("*.json"):
-		name = p.stem
-		if name.isdigit():
-			n = int(name)
-			if n > max_n:
-				max_n = n
+	if not output_dir.is_dir():
+		return 1
+	# Una sola pasada con os.scandir: solo se miran los nombres, sin construir Path por entrada
+	with os.scandir(output_dir) as it:
+		for e in it:
+			name = e.name
+			if name.endswith(".json"):
+				stem = name[:-5]
+				if stem.isdigit():
+					n = int(stem)
+					if n > max_n:
+						max_n = n
 	return max_n + 1
 
 
 def guardar_json_con_consecutivo(output_dir: Path, data: Dict[str, Any]) -> Path:
 	output_dir.mkdir(parents=True, exist_ok=True)
-	n = siguiente_consecutivo(output_dir)
+	return guardar_json_con_numero(output_dir, data, siguiente_consecutivo(output_dir))
+
+
+def guardar_json_con_numero(output_dir: Path, data: Dict[str, Any], n: int) -> Path:
+	"""Guarda data como N.json con un consecutivo ya calculado (output_dir debe existir)."""
 	out_path = output_dir / f"{n}.json"
-	with out_path.open("w", encoding="utf-8") as f:
-		json.dump(data, f, ensure_ascii=False, indent=2)
+	if orjson is not None:
+		# orjson emite UTF-8 (equivalente a ensure_ascii=False) con indentación de 2 espacios; los
+		# bytes van directo al descriptor con os.write, sin pasar por la capa de buffer de Python
+		buf = memoryview(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+		fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+		try:
+			while buf:
+				buf = buf[os.write(fd, buf):]
+		finally:
+			os.close(fd)
+	else:
+		# Serializar por fragmentos directo al archivo (sin armar el JSON completo como str) y con
+		# un buffer grande para que los fragmentos pequeños de iterencode no sean un write() cada uno
+		with out_path.open("w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+			for chunk in _JSON_ENCODER.iterencode(data):
+				f.write(chunk)
 	return out_path
 
 
+def _marcador(output_dir: Path, xlsx: Path) -> Path:
+	return output_dir / f"{xlsx.stem}.done"
+
+
+def _huella(st: os.stat_result) -> List[int]:
+	return [st.st_mtime_ns, st.st_size]
+
+
+def ya_procesado(output_dir: Path, xlsx: Path) -> bool:
+	"""True si el .xlsx ya se exportó y no cambió desde entonces.
+
+	El marcador <nombre>.done en output_dir guarda (mtime_ns, tamaño) del .xlsx y del JSON generado,
+	y la versión del extractor; es vigente solo si todo coincide exactamente. No basta con comparar
+	fechas (una copia en Windows conserva el mtime original) ni con que el JSON exista (otro archivo
+	puede haber ocupado ese número).
+	"""
+	try:
+		marca = json.loads(_marcador(output_dir, xlsx).read_text(encoding="utf-8"))
+		if not isinstance(marca, dict) or marca.get("version") != VERSION_EXTRACCION:
+			return False
+		if marca.get("xlsx") != _huella(xlsx.stat()):
+			return False
+		destino = marca.get("json")
+		return isinstance(destino, str) and marca.get("json_huella") == _huella(os.stat(destino))
+	except (OSError, ValueError):
+		return False
+
+
+def marcar_procesado(output_dir: Path, xlsx: Path, out_path: Path) -> None:
+	marca = {
+		"version": VERSION_EXTRACCION,
+		"xlsx": _huella(xlsx.stat()),
+		"json": str(out_path.resolve()),
+		"json_huella": _huella(out_path.stat()),
+	}
+	_marcador(output_dir, xlsx).write_text(json.dumps(marca), encoding="utf-8")
+
+
 def listar_excels(input_dir: Path) -> List[Path]:
 	"""Lista archivos .xlsx válidos (excluye temporales ~) en input_dir."""
 	if not input_dir.exists():
 		input_dir.mkdir(parents=True, exist_ok=True)
-	return [p for p in input_dir.glob("*.xlsx") if not p.name.startswith("~$")]
+	with os.scandir(input_dir) as it:
+		return [
+			input_dir / e.name
+			for e in it
+			# Extensión sin distinguir mayúsculas (FOO.XLSX), como glob en Windows
+			if e.name.lower().endswith(".xlsx") and not e.name.startswith("~$") and e.is_file()
+		]
 
 
 def parse_args():
@@ -618,6 +1000,26 @@ def parse_args():
 	parser.add_argument("--elem-row-start", type=int, default=12, help="Fila inicial del rango de elementos (por defecto: 12)")
 	parser.add_argument("--elem-col-end", default="S", help="Columna final del rango de elementos (por defecto: S)")
 	parser.add_argument("--elem-row-end", type=int, default=27, help="Fila final del rango de elementos (por defecto: 27)")
+	parser.add_argument(
+		"--workers",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Procesos para leer los .xlsx en paralelo; 1 = secuencial (por defecto: núcleos de CPU)",
+	)
+	parser.add_argument(
+		"--lector",
+		choices=["openpyxl", "xml", "calamine"],
+		default="openpyxl",
+		help=(
+			"Lector de .xlsx: openpyxl, 'xml' (lee el zip directamente) o 'calamine' "
+			"(requiere python-calamine) (por defecto: openpyxl)"
+		),
+	)
+	parser.add_argument(
+		"--force",
+		action="store_true",
+		help="Reprocesar todos los .xlsx aunque tengan marcador .done vigente en la carpeta de salida",
+	)
 	return parser.parse_args()
 
 
@@ -637,25 +1039,40 @@ def main():
 
 	print(f"[INFO] Archivos a procesar: {len(excels)} en '{input_dir.resolve()}'")
 
+	output_dir.mkdir(parents=True, exist_ok=True)
+	pendientes = sorted(excels)
+	if not args.force:
+		# Omitir los .xlsx que no cambiaron desde su última exportación
+		pendientes = [x for x in pendientes if not ya_procesado(output_dir, x)]
+		omitidos = len(excels) - len(pendientes)
+		if omitidos:
+			print(f"[INFO] Omitidos {omitidos} .xlsx sin cambios (usa --force para reprocesarlos)")
+
+	# Calcular el consecutivo una sola vez y avanzarlo en memoria (evita listar output_dir por archivo)
+	siguiente = siguiente_consecutivo(output_dir)
 	procesados = 0
-	for xlsx in sorted(excels):
+	resultados = procesar_archivos(
+		pendientes,
+		workers=args.workers,
+		lector=args.lector,
+		letra_celda_codigo=args.code_col,
+		numero_celda_codigo=args.code_row_start,
+		letra_celda_inicio_elementos=args.elem_col_start,
+		numero_celda_inicio_elementos=args.elem_row_start,
+		letra_celda_fin_elementos=args.elem_col_end,
+		numero_celda_fin_elementos=args.elem_row_end,
+		steps=args.steps,
+	)
+	# Los JSON se escriben en el proceso principal para que los consecutivos sigan el orden de los archivos
+	for xlsx, data in resultados:
 		print(f"[INFO] Procesando: {xlsx.name}")
 
-		data = procesar_archivo(
-			xlsx,
-			letra_celda_codigo=args.code_col,
-			numero_celda_codigo=args.code_row_start,
-			letra_celda_inicio_elementos=args.elem_col_start,
-			numero_celda_inicio_elementos=args.elem_row_start,
-			letra_celda_fin_elementos=args.elem_col_end,
-			numero_celda_fin_elementos=args.elem_row_end,
-			steps=args.steps,
-		)
-
 		if data is None:
 			continue
 
-		out_path = guardar_json_con_consecutivo(output_dir, data)
+		out_path = guardar_json_con_numero(output_dir, data, siguiente)
+		siguiente += 1
+		marcar_procesado(output_dir, xlsx, out_path)
 		print(f"[OK] Exportado: {out_path}")
 		procesados += 1
 
@@ -663,5 +1080,7 @@ def main():
 
 
 if __name__ == "__main__":
+	# Necesario para el pool de procesos en el ejecutable congelado (PyInstaller) de Windows
+	multiprocessing.freeze_support()
 	main()
 
@@ -1,26 +1,65 @@
 import argparse
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+# Sesión compartida: reutiliza conexiones (keep-alive) y reintenta fallos transitorios
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504]),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+
+def load_json(path: Path) -> Any:
+    if orjson is not None:
+        # orjson parsea directamente los bytes (sin decodificar a str)
+        return orjson.loads(path.read_bytes())
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: Path, data: Any) -> None:
+    if orjson is not None:
+        # orjson siempre emite UTF-8 (equivalente a ensure_ascii=False) con indentación de 2
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
 
 
 def load_uris(uris_path: Path) -> Dict[str, Any]:
-    with uris_path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return load_json(uris_path)
 
 
 def load_config(config_path: Path) -> Dict[str, Any]:
     """Carga un archivo de configuración opcional. Si no existe, devuelve {}."""
     if not config_path.exists():
         return {}
-    with config_path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return load_json(config_path)
 
 
 def load_budget_map(path: Optional[str]) -> Dict[str, Any]:
-    """Carga un mapa opcional de budget_id por archivo: {"1.json": 123, ...}."""
+    """Carga un mapa opcional de budget_id por archivo: {"1.json": 123, ...}.
+
+    Las llaves se devuelven canónicas (strip().lower()) para que la búsqueda por nombre de archivo no
+    dependa de mayúsculas o espacios en el JSON; quien busca normaliza el nombre igual.
+    """
     if not path:
         return {}
     p = Path(path)
@@ -28,20 +67,20 @@ def load_budget_map(path: Optional[str]) -> Dict[str, Any]:
         print(f"[WARN] budget-map no existe: {p}")
         return {}
     try:
-        with p.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                return data
+        data = load_json(p)
+        if isinstance(data, dict):
+            return {str(k).strip().lower(): v for k, v in data.items()}
     except Exception as e:
         print(f"[WARN] No se pudo leer budget-map: {e}")
     return {}
 
 
-def fetch_get_chapters(uris: Dict[str, Any], *, token: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+def fetch_get_chapters(uris: Dict[str, Any], *, token: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
     """Obtiene los datos del endpoint get_chapters.
 
     Devuelve una lista de objetos con llaves: category, id (posible id interno), region, subcategory[].
     Tolera que el endpoint responda un objeto único o una lista de objetos.
+    `session` permite reutilizar la sesión (y sus conexiones) de quien llama; por defecto la del módulo.
     """
     ep = uris.get("endpoints", {}).get("get_chapters")
     if not ep:
@@ -61,9 +100,9 @@ def fetch_get_chapters(uris: Dict[str, Any], *, token: Optional[str] = None, ext
     if extra_headers:
         headers.update(extra_headers)
 
-    resp = requests.get(url, headers=headers or None, timeout=30)
+    resp = (session or _SESSION).get(url, headers=headers or None, timeout=30)
     resp.raise_for_status()
-    data = resp.json()
+    data = orjson.loads(resp.content) if orjson is not None else resp.json()
     if isinstance(data, list):
         return data
     if isinstance(data, dict):
@@ -92,27 +131,29 @@ def build_mappings(chapters: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict
         
         # Deducir el prefijo de código a partir del apu de cualquier subcategoría
         for sc in subcats:
-            apu = sc.get("apu")
-            sc_id = sc.get("id")
-            if apu:
-                apu_to_subcat_id[str(apu)] = str(sc_id) if sc_id is not None else None  # type: ignore
-                # Prefijo antes del punto
-                code_prefix = str(apu).split(".")[0]
-                if outer_id is not None:
-                    code_to_category_id[code_prefix] = str(sc.get("category_id"))
-                # Metadatos por apu
-                meta: Dict[str, Any] = {"apu": str(apu)}
-                # category_id desde el item exterior
-                if outer_id is not None:
-                    meta["category_id"] = str(sc.get("category_id"))
-                # nombre y unidad del subcapítulo
-                name = sc.get("name") or sc.get("label") or sc.get("description")
-                unit = sc.get("unit") or sc.get("measure") or sc.get("measurement_unit")
-                if name is not None:
-                    meta["name"] = name
-                if unit is not None:
-                    meta["unit"] = unit
-                apu_to_meta[str(apu)] = meta
+            get = sc.get
+            apu = get("apu")
+            if not apu:
+                continue
+            # La llave str del apu y el category_id se calculan una sola vez por subcategoría
+            apu_key = apu if type(apu) is str else str(apu)
+            sc_id = get("id")
+            apu_to_subcat_id[apu_key] = str(sc_id) if sc_id is not None else None  # type: ignore
+            # Metadatos por apu
+            meta: Dict[str, Any] = {"apu": apu_key}
+            if outer_id is not None:
+                # category_id desde el item exterior, indexado por el prefijo antes del punto
+                category_id = str(get("category_id"))
+                code_to_category_id[apu_key.partition(".")[0]] = category_id
+                meta["category_id"] = category_id
+            # nombre y unidad del subcapítulo
+            name = get("name") or get("label") or get("description")
+            unit = get("unit") or get("measure") or get("measurement_unit")
+            if name is not None:
+                meta["name"] = name
+            if unit is not None:
+                meta["unit"] = unit
+            apu_to_meta[apu_key] = meta
 
     return apu_to_subcat_id, code_to_category_id, apu_to_meta
 
@@ -124,77 +165,101 @@ def transform_budget_json(data: Dict[str, Any], apu_to_subcat_id: Dict[str, str]
     - categories[*].subcategories[*].id => reemplazar por apu_to_subcat_id[id] si existe (como str)
     - categories[*].subcategories[*] => añadir apu, category_id, name, unit desde apu_to_meta
     """
-    result = json.loads(json.dumps(data))  # copia profunda segura
+    # Copia superficial por niveles: solo se reconstruyen los dicts que se modifican (categorías y
+    # subcategorías); quantity_details y demás valores se comparten por referencia, ya que no se tocan.
+    result = dict(data)
     categories = result.get("categories") or []
+    # Métodos de búsqueda como locales: se invocan por cada categoría/subcategoría
+    codes_get = code_to_category_id.get
+    apu_get = apu_to_subcat_id.get
+    meta_get = apu_to_meta.get
+    new_categories: List[Dict[str, Any]] = []
     for cat in categories:
+        cat = dict(cat)
+        new_categories.append(cat)
         # Resolver id de categoría
         original_code = cat.get("codigo") if "codigo" in cat else cat.get("id")
         new_id = None
         if original_code is not None:
-            mapped = code_to_category_id.get(str(original_code))
+            code_key = original_code if type(original_code) is str else str(original_code)
+            mapped = codes_get(code_key)
             # Preferir id numérico
             try:
                 if mapped is not None and str(mapped).isdigit():
                     new_id = int(str(mapped))
-                elif str(original_code).isdigit():
-                    new_id = int(str(original_code))
+                elif code_key.isdigit():
+                    new_id = int(code_key)
                 else:
-                    new_id = mapped if mapped is not None else str(original_code)
+                    new_id = mapped if mapped is not None else code_key
             except Exception:
-                new_id = mapped if mapped is not None else str(original_code)
+                new_id = mapped if mapped is not None else code_key
         if new_id is not None:
             cat["id"] = new_id
         # Eliminar 'codigo' para cumplir con el nuevo nombre
         if "codigo" in cat:
             del cat["codigo"]
 
+        # category_id de respaldo (id de categoría resuelto, como int cuando sea posible): es igual
+        # para todas las subcategorías, así que se calcula una vez por categoría
+        try:
+            if new_id is not None and str(new_id).isdigit():
+                fallback_category_id = int(str(new_id))
+            else:
+                fallback_category_id = new_id
+        except Exception:
+            fallback_category_id = new_id
+
         subcats = cat.get("subcategories") or []
+        new_subcats: List[Dict[str, Any]] = []
         for sc in subcats:
-            original_apu = sc.get("id")
+            sc = dict(sc)
+            new_subcats.append(sc)
+            # El id original es a la vez la llave de apu_to_subcat_id y de apu_to_meta
             sc_id = sc.get("id")
-            if sc_id is not None:
-                mapped_id = apu_to_subcat_id.get(str(sc_id))
+            key = None if sc_id is None else (sc_id if type(sc_id) is str else str(sc_id))
+            if key is not None:
+                mapped_id = apu_get(key)
                 if mapped_id is not None:
                     # Forzar entero si es dígito
                     try:
-                        sc["id"] = int(str(mapped_id)) if str(mapped_id).isdigit() else mapped_id
+                        sc["id"] = int(mapped_id) if mapped_id.isdigit() else mapped_id
                     except Exception:
                         sc["id"] = mapped_id
                 else:
                     # Si el id original es numérico, convertir a int
                     try:
-                        if str(sc_id).isdigit():
-                            sc["id"] = int(str(sc_id))
+                        if key.isdigit():
+                            sc["id"] = int(key)
                     except Exception:
                         pass
             # Enriquecimiento con metadatos
-            meta = apu_to_meta.get(str(original_apu)) if original_apu is not None else None
+            meta = meta_get(key) if key is not None else None
             if isinstance(meta, dict):
-                sc["apu"] = meta.get("apu", str(original_apu))
+                sc["apu"] = meta.get("apu", key)
                 # Fallback de category_id al id de categoría ya resuelto, forzando número cuando sea posible
-                cat_id_val = meta.get("category_id") if meta.get("category_id") is not None else new_id
-                try:
-                    if cat_id_val is not None and str(cat_id_val).isdigit():
-                        sc["category_id"] = int(str(cat_id_val))
-                    else:
-                        sc["category_id"] = cat_id_val
-                except Exception:
-                    sc["category_id"] = cat_id_val
+                meta_category_id = meta.get("category_id")
+                if meta_category_id is None:
+                    sc["category_id"] = fallback_category_id
+                else:
+                    try:
+                        if str(meta_category_id).isdigit():
+                            sc["category_id"] = int(str(meta_category_id))
+                        else:
+                            sc["category_id"] = meta_category_id
+                    except Exception:
+                        sc["category_id"] = meta_category_id
                 if "name" in meta:
                     sc["name"] = meta["name"]
                 if "unit" in meta:
                     sc["unit"] = meta["unit"]
             else:
-                if original_apu is not None:
-                    sc["apu"] = str(original_apu)
-                # Fallback de category_id al id de la categoría resuelta, intentando int
-                try:
-                    if new_id is not None and str(new_id).isdigit():
-                        sc["category_id"] = int(str(new_id))
-                    else:
-                        sc["category_id"] = new_id
-                except Exception:
-                    sc["category_id"] = new_id
+                if key is not None:
+                    sc["apu"] = key
+                sc["category_id"] = fallback_category_id
+        if subcats:
+            cat["subcategories"] = new_subcats
+    if categories:
+        result["categories"] = new_categories
     return result
 
 
@@ -202,6 +267,50 @@ def list_json_files(input_dir: Path) -> List[Path]:
     return sorted([p for p in input_dir.glob("*.json") if p.is_file()])
 
 
+# Estado compartido por los workers: se fija una sola vez por proceso (initializer) en lugar de
+# serializar los mapeos con cada archivo
+_WORKER_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(
+    mappings: Tuple[Dict[str, str], Dict[str, str], Dict[str, Dict[str, Any]]],
+    budget_map: Dict[str, Any],
+    budget_id: Optional[int],
+    output_dir: Path,
+) -> None:
+    _WORKER_STATE["mappings"] = mappings
+    _WORKER_STATE["budget_map"] = budget_map
+    _WORKER_STATE["budget_id"] = budget_id
+    _WORKER_STATE["output_dir"] = output_dir
+
+
+def _transformar_archivo(p: Path) -> Tuple[str, Optional[Path], Optional[str]]:
+    """Lee, transforma y escribe un JSON. Devuelve (nombre, ruta_salida, error_de_lectura)."""
+    try:
+        data = load_json(p)
+    except Exception as e:
+        return p.name, None, str(e)
+
+    apu_to_subcat_id, code_to_category_id, apu_to_meta = _WORKER_STATE["mappings"]
+    new_data = transform_budget_json(data, apu_to_subcat_id, code_to_category_id, apu_to_meta)
+
+    # Resolver budget_id (prioridad: budget_map[filename] -> --budget-id -> data.get("budget_id") -> None)
+    filename = p.name.strip().lower()
+    budget_map = _WORKER_STATE["budget_map"]
+    if filename in budget_map:
+        resolved_budget_id = budget_map[filename]
+    elif _WORKER_STATE["budget_id"] is not None:
+        resolved_budget_id = _WORKER_STATE["budget_id"]
+    else:
+        resolved_budget_id = data.get("budget_id")
+
+    # Asegurar clave presente, aunque sea None (null)
+    new_data["budget_id"] = resolved_budget_id if resolved_budget_id is not None else None
+    out_path = _WORKER_STATE["output_dir"] / p.name
+    save_json(out_path, new_data)
+    return filename, out_path, None
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Mapea 'codigo' e 'id' en JSONs generados usando el endpoint get_chapters y escribe a una carpeta nueva."
@@ -222,6 +331,12 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Ruta a JSON con mapa por archivo: {\"1.json\": 123, ...}; tiene prioridad sobre --budget-id",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos para transformar archivos en paralelo (por defecto: 1, secuencial)",
+    )
     return parser.parse_args()
 
 
@@ -256,14 +371,13 @@ def main() -> None:
     chapters: List[Dict[str, Any]]
     if args.chapters_file:
         cf = Path(args.chapters_file)
-        with cf.open("r", encoding="utf-8") as f:
-            raw = json.load(f)
-            if isinstance(raw, dict):
-                chapters = [raw]
-            elif isinstance(raw, list):
-                chapters = raw
-            else:
-                raise RuntimeError("Formato inválido en chapters-file")
+        raw = load_json(cf)
+        if isinstance(raw, dict):
+            chapters = [raw]
+        elif isinstance(raw, list):
+            chapters = raw
+        else:
+            raise RuntimeError("Formato inválido en chapters-file")
         print(f"[INFO] Usando chapters desde archivo local: {cf}")
     else:
         print("[INFO] Consultando endpoint get_chapters...")
@@ -279,36 +393,34 @@ def main() -> None:
         print(f"[INFO] No se encontraron JSON en {input_dir.resolve()}")
         return
 
-    transformed = 0
-    for p in files:
-        try:
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}': {e}")
-            continue
-
-        new_data = transform_budget_json(data, apu_to_subcat_id, code_to_category_id, apu_to_meta)
-
-        # Resolver budget_id (prioridad: budget_map[filename] -> --budget-id -> data.get("budget_id") -> None)
-        filename = p.name
-        if filename in budget_map:
-            resolved_budget_id = budget_map.get(filename)
-        elif args.budget_id is not None:
-            resolved_budget_id = args.budget_id
-        else:
-            resolved_budget_id = data.get("budget_id")
+    # Cada archivo es independiente: con --workers > 1 se reparten en un pool de procesos;
+    # map() conserva el orden de entrada, así que los mensajes salen igual que en secuencial
+    initargs = ((apu_to_subcat_id, code_to_category_id, apu_to_meta), budget_map, args.budget_id, output_dir)
+    workers = min(max(1, args.workers), len(files))
+    executor: Optional[ProcessPoolExecutor] = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+        resultados = executor.map(_transformar_archivo, files)
+    else:
+        _init_worker(*initargs)
+        resultados = map(_transformar_archivo, files)
 
-        # Asegurar clave presente, aunque sea None (null)
-        new_data["budget_id"] = resolved_budget_id if resolved_budget_id is not None else None
-        out_path = output_dir / p.name
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(new_data, f, ensure_ascii=False, indent=2)
-        print(f"[OK] Transformado -> {out_path}")
-        transformed += 1
+    transformed = 0
+    try:
+        for name, out_path, error in resultados:
+            if out_path is None:
+                print(f"[WARN] No se pudo leer '{name}': {error}")
+                continue
+            print(f"[OK] Transformado -> {out_path}")
+            transformed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     print(f"[RESUMEN] Transformados {transformed} archivos en '{output_dir.resolve()}'")
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el ejecutable congelado (PyInstaller) de Windows
+    multiprocessing.freeze_support()
     main()
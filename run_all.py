@@ -1,25 +1,52 @@
 import argparse
+import errno
+import hashlib
 import json
+import logging
+import multiprocessing
+import os
 import shutil
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging.handlers import MemoryHandler
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 # Reusar funciones de los módulos existentes
 import main as extractor
 import map_chapters as mapper
 import build_payloads as payloads
 
+log = logging.getLogger(__name__)
+
+
+def _setup_logging() -> None:
+    """Salida por logging a stdout con búfer: se escribe por lotes de 1024 mensajes, al llegar un
+    WARNING o ERROR y al terminar cada paso (_flush_log), en lugar de un write por cada línea."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[MemoryHandler(capacity=1024, flushLevel=logging.WARNING, target=handler)])
+
+
+def _flush_log() -> None:
+    # Vaciar el búfer al terminar cada paso (para que el avance se vea y no se pierda si el proceso
+    # muere) y antes de llamar a código que escribe directo con print (main.py, map_chapters), para
+    # no alterar el orden de la salida
+    for h in logging.getLogger().handlers:
+        h.flush()
+
 
 def _load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    # orjson cuando está disponible (con respaldo a json estándar), igual que build_payloads
+    return payloads.load_json(path)
 
 
 def _save_json(path: Path, data: Any) -> None:
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Mismo formato que json.dump(..., ensure_ascii=False, indent=2); escritura atómica
+    payloads.save_json(path, data)
 
 
 def _resolve_auth(config: Dict[str, Any], cli_token: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
@@ -42,7 +69,7 @@ def _preflight_auth_or_exit(uris: Dict[str, Any], token: Optional[str], extra_he
     if not need_online:
         return True
     if not token:
-        print("[ERROR] No hay token de autenticación y se requieren endpoints online. Agrega el token en config.json o usa --auth-token.")
+        log.error("[ERROR] No hay token de autenticación y se requieren endpoints online. Agrega el token en config.json o usa --auth-token.")
         return False
     # Usar get_users como verificación rápida
     ep = uris.get("endpoints", {}).get("get_users")
@@ -62,9 +89,9 @@ def _preflight_auth_or_exit(uris: Dict[str, Any], token: Optional[str], extra_he
     if extra_headers:
         headers.update(extra_headers)
     try:
-        resp = requests.get(url, headers=headers or None, timeout=10)
+        resp = payloads.get_session().get(url, headers=headers or None, timeout=10)
     except Exception as e:
-        print(f"[WARN] No se pudo validar el token (red): {e}. Se continuará, pero podría fallar luego.")
+        log.warning("[WARN] No se pudo validar el token (red): %s. Se continuará, pero podría fallar luego.", e)
         return True
     # Si el servidor responde con error explícito de token inválido, abortar
     try:
@@ -72,10 +99,10 @@ def _preflight_auth_or_exit(uris: Dict[str, Any], token: Optional[str], extra_he
     except Exception:
         data = None
     if isinstance(data, dict) and str(data.get("error", "")).lower() == "invalid token":
-        print("[ERROR] Token inválido. Reemplaza el token en config.json o pasa --auth-token=<TOKEN>. Se aborta antes de procesar XLSX.")
+        log.error("[ERROR] Token inválido. Reemplaza el token en config.json o pasa --auth-token=<TOKEN>. Se aborta antes de procesar XLSX.")
         return False
     if resp.status_code == 401:
-        print("[ERROR] Autenticación fallida (401). Reemplaza el token en config.json o pasa --auth-token=<TOKEN>. Se aborta antes de procesar XLSX.")
+        log.error("[ERROR] Autenticación fallida (401). Reemplaza el token en config.json o pasa --auth-token=<TOKEN>. Se aborta antes de procesar XLSX.")
         return False
     return True
 
@@ -88,13 +115,20 @@ def step_submit_payloads(mapped_dir: Path, uris: Dict[str, Any], token: Optional
     ep_create = uris.get("endpoints", {}).get("create_budget") or {}
     ep_update = uris.get("endpoints", {}).get("update_budget") or {}
 
+    # Sesión propia para los envíos: mantiene keep-alive entre archivos pero sin reintentos
+    # (max_retries=0). La sesión compartida de las consultas GET reintenta 5xx/429, lo que re-enviaría
+    # un create/update y ocultaría el status y el cuerpo de la respuesta real detrás de un RetryError
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
     sent_ok = 0
     failed = 0
     for p in sorted(mapped_dir.glob("*.json")):
         try:
             obj = _load_json(p)
         except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}' para envío: {e}")
+            log.warning("[WARN] No se pudo leer '%s' para envío: %s", p.name, e)
             failed += 1
             continue
         if not (isinstance(obj, dict) and "beneficiary_id" in obj):
@@ -113,7 +147,7 @@ def step_submit_payloads(mapped_dir: Path, uris: Dict[str, Any], token: Optional
         if update_aiu:
             # update -> requiere budget_id en path
             if budget_id is None:
-                print(f"[WARN] '{p.name}' update_aiu=true pero sin budget_id; se omite envío")
+                log.warning("[WARN] '%s' update_aiu=true pero sin budget_id; se omite envío", p.name)
                 failed += 1
                 continue
             url = str(ep_update.get("uri", "")).replace("{{budget_id}}", str(budget_id))
@@ -126,7 +160,7 @@ def step_submit_payloads(mapped_dir: Path, uris: Dict[str, Any], token: Optional
             ep_headers = ep_create.get("headers") if isinstance(ep_create.get("headers"), dict) else {}
 
         if not url:
-            print(f"[WARN] '{p.name}' sin URL configurada para el endpoint correspondiente; se omite")
+            log.warning("[WARN] '%s' sin URL configurada para el endpoint correspondiente; se omite", p.name)
             failed += 1
             continue
 
@@ -144,65 +178,178 @@ def step_submit_payloads(mapped_dir: Path, uris: Dict[str, Any], token: Optional
 
         try:
             if method == "POST":
-                r = requests.post(url, headers=headers, json=body, timeout=30)
+                r = session.post(url, headers=headers, json=body, timeout=30)
             elif method == "PUT":
-                r = requests.put(url, headers=headers, json=body, timeout=30)
+                r = session.put(url, headers=headers, json=body, timeout=30)
             else:
-                print(f"[WARN] Método no soportado para envío: {method}")
+                log.warning("[WARN] Método no soportado para envío: %s", method)
                 failed += 1
                 continue
         except Exception as e:
-            print(f"[ERROR] Envío fallido para '{p.name}': {e}")
+            log.error("[ERROR] Envío fallido para '%s': %s", p.name, e)
             failed += 1
             continue
 
         # Interpretar resultado
         if 200 <= r.status_code < 300:
-            print(f"[SENT] {method} {url} <- {p.name} [{r.status_code}]")
+            log.info("[SENT] %s %s <- %s [%s]", method, url, p.name, r.status_code)
             sent_ok += 1
+            # Cada envío espera la red: vaciar aquí no pesa y muestra el avance de un lote largo
+            _flush_log()
         else:
             try:
                 err = r.json()
             except Exception:
                 err = r.text
-            print(f"[FAIL] {method} {url} <- {p.name} [{r.status_code}]: {err}")
+            log.error("[FAIL] %s %s <- %s [%s]: %s", method, url, p.name, r.status_code, err)
             failed += 1
 
-    print(f"[RESUMEN] Envíos: OK={sent_ok}, FAIL={failed}")
+    session.close()
+    log.info("[RESUMEN] Envíos: OK=%s, FAIL=%s", sent_ok, failed)
+    _flush_log()
     return sent_ok, failed
 
 
+def _find_xlsx(root: Path) -> Iterator[Path]:
+    """Recorre root recursivamente con os.scandir y entrega los .xlsx (excluye temporales ~$).
+
+    DirEntry cachea el tipo de cada entrada, así que no hay stat extra por archivo como con
+    Path.rglob. Igual que rglob, no se siguen enlaces simbólicos a directorios. La extensión se
+    compara sin distinguir mayúsculas (FOO.XLSX), como rglob en Windows.
+    """
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(Path(e.path))
+                    elif e.name.lower().endswith(".xlsx") and not e.name.startswith("~$"):
+                        yield Path(e.path)
+        except OSError:
+            pass
+
+
+# Caché de extracción entre corridas: un archivo por .xlsx con (mtime_ns, tamaño, parámetros) y los
+# datos extraídos; el nombre es el hash de la ruta absoluta del libro
+EXTRACT_CACHE_DIR = Path(".cache") / "run_all" / "extract"
+
+
+def _cache_entry_path(key: str) -> Path:
+    return EXTRACT_CACHE_DIR / f"{hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()}.json"
+
+
+def _load_cache_entry(path: Path, params: List[Any], st: os.stat_result) -> Optional[Dict[str, Any]]:
+    """Datos extraídos guardados en path si siguen vigentes para el .xlsx (mismo mtime_ns, tamaño y
+    parámetros de extracción); None si no existe, es inválido o quedó desactualizado."""
+    try:
+        entry = _load_json(path)
+    except Exception:
+        return None
+    if (
+        not isinstance(entry, dict)
+        or entry.get("params") != params
+        or entry.get("mtime_ns") != st.st_mtime_ns
+        or entry.get("size") != st.st_size
+    ):
+        return None
+    data = entry.get("data")
+    return data if isinstance(data, dict) else None
+
+
+def _prune_cache(keep: set) -> None:
+    # Quitar entradas de libros que ya no están en la entrada, para que el caché no crezca sin límite
+    try:
+        with os.scandir(EXTRACT_CACHE_DIR) as it:
+            for e in it:
+                if e.name.endswith(".json") and e.name not in keep:
+                    try:
+                        os.unlink(e.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+
 def step_extract_xlsx_to_json(input_dir: Path, output_dir: Path, args) -> List[Path]:
     # Buscar .xlsx recursivamente (excluye temporales ~) en todo input_dir
     if not input_dir.exists():
         input_dir.mkdir(parents=True, exist_ok=True)
-    excels = [p for p in input_dir.rglob("*.xlsx") if not p.name.startswith("~$")]
+    excels = list(_find_xlsx(input_dir))
     if not excels:
-        print(f"[INFO] No hay .xlsx en '{input_dir.resolve()}'. Se omite extracción.")
+        log.info("[INFO] No hay .xlsx en '%s'. Se omite extracción.", input_dir.resolve())
         return []
-    print(f"[STEP] Extrayendo XLSX -> JSON ({len(excels)})...")
+    log.info("[STEP] Extrayendo XLSX -> JSON (%s)...", len(excels))
     produced: List[Path] = []
-    for xlsx in sorted(excels):
-        data = extractor.procesar_archivo(
-            xlsx,
-            letra_celda_codigo=args.code_col,
-            numero_celda_codigo=args.code_row_start,
-            letra_celda_inicio_elementos=args.elem_col_start,
-            numero_celda_inicio_elementos=args.elem_row_start,
-            letra_celda_fin_elementos=args.elem_col_end,
-            numero_celda_fin_elementos=args.elem_row_end,
-            steps=args.steps,
-        )
+    # El consecutivo se calcula una sola vez y se incrementa localmente (antes se re-escaneaba
+    # output_dir por cada archivo guardado)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    siguiente = extractor.siguiente_consecutivo(output_dir)
+    excels.sort()
+
+    # Un .xlsx con el mismo mtime_ns y tamaño que en la última corrida (y extraído con la misma
+    # versión del extractor, lector y parámetros) reutiliza los datos del caché sin abrir el libro.
+    # Solo se leen y escriben las entradas de los libros de esta corrida.
+    params = [
+        extractor.VERSION_EXTRACCION, args.lector,
+        args.code_col, args.code_row_start, args.elem_col_start, args.elem_row_start, args.elem_col_end, args.elem_row_end, args.steps,
+    ]
+    entradas: List[Tuple[Path, os.stat_result, Optional[Dict[str, Any]]]] = []
+    pendientes: List[Path] = []
+    for x in excels:
+        st = x.stat()
+        cache_path = _cache_entry_path(str(x.resolve()))
+        data = None if args.no_cache else _load_cache_entry(cache_path, params, st)
         if data is None:
-            continue
-        out = extractor.guardar_json_con_consecutivo(output_dir, data)
-        print(f"[OK] JSON: {out}")
+            pendientes.append(x)
+        entradas.append((cache_path, st, data))
+    if len(pendientes) < len(excels):
+        log.info("[INFO] Reutilizados %s .xlsx sin cambios desde el caché (usa --no-cache para reprocesarlos)", len(excels) - len(pendientes))
+
+    # Los libros se leen en un pool de procesos (extractor.procesar_archivos) y llegan en el orden
+    # de entrada, así que los consecutivos se asignan aquí en el proceso principal sin carreras
+    _flush_log()
+    resultados = extractor.procesar_archivos(
+        pendientes,
+        workers=args.workers,
+        lector=args.lector,
+        letra_celda_codigo=args.code_col,
+        numero_celda_codigo=args.code_row_start,
+        letra_celda_inicio_elementos=args.elem_col_start,
+        numero_celda_inicio_elementos=args.elem_row_start,
+        letra_celda_fin_elementos=args.elem_col_end,
+        numero_celda_fin_elementos=args.elem_row_end,
+        steps=args.steps,
+    )
+    if pendientes and not args.no_cache:
+        EXTRACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for cache_path, st, data in entradas:
+        if data is None:
+            _xlsx, data = next(resultados)
+            if data is None:
+                continue
+            if not args.no_cache:
+                try:
+                    _save_json(cache_path, {"params": params, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "data": data})
+                except Exception as e:
+                    log.warning("[WARN] No se pudo guardar el caché de '%s': %s", _xlsx.name, e)
+        out = extractor.guardar_json_con_numero(output_dir, data, siguiente)
+        siguiente += 1
+        log.info("[OK] JSON: %s", out)
         produced.append(out)
-    print(f"[RESUMEN] XLSX->JSON: {len(produced)} archivos en '{output_dir.resolve()}'")
+    if not args.no_cache:
+        _prune_cache({cache_path.name for cache_path, _st, _data in entradas})
+    log.info("[RESUMEN] XLSX->JSON: %s archivos en '%s'", len(produced), output_dir.resolve())
+    _flush_log()
     return produced
 
 
-def step_map_chapters(json_input_dir: Path, mapped_dir: Path, uris: Dict[str, Any], token: Optional[str], extra_headers: Optional[Dict[str, str]], chapters_file: Optional[Path], budget_id: Optional[int], budget_map: Dict[str, Any]) -> int:
+def step_map_chapters(json_input_dir: Path, mapped_dir: Path, uris: Dict[str, Any], token: Optional[str], extra_headers: Optional[Dict[str, str]], chapters_file: Optional[Path], budget_id: Optional[int], budget_map: Dict[str, Any], chapters_future: Optional[Future] = None, workers: int = 8, persist: bool = True) -> List[Tuple[Path, Dict[str, Any]]]:
+    """Mapea los JSON de json_input_dir y devuelve [(ruta en mapped_dir, datos mapeados)] en orden.
+
+    Con persist=False no se escriben los intermedios: el paso siguiente recibe los datos en memoria.
+    """
     # Cargar chapters
     if chapters_file:
         raw = _load_json(chapters_file)
@@ -212,29 +359,33 @@ def step_map_chapters(json_input_dir: Path, mapped_dir: Path, uris: Dict[str, An
             chapters = raw
         else:
             raise RuntimeError("Formato inválido en chapters-file")
-        print(f"[INFO] Chapters desde archivo local: {chapters_file}")
+        log.info("[INFO] Chapters desde archivo local: %s", chapters_file)
     else:
-        print("[INFO] Consultando get_chapters...")
-        chapters = mapper.fetch_get_chapters(uris, token=token, extra_headers=extra_headers)
+        log.info("[INFO] Consultando get_chapters...")
+        if chapters_future is not None:
+            # Consulta lanzada en segundo plano por main(); result() re-lanza su excepción si falló
+            chapters = chapters_future.result()
+        else:
+            chapters = mapper.fetch_get_chapters(uris, token=token, extra_headers=extra_headers, session=payloads.get_session())
 
     apu_to_subcat_id, code_to_category_id, apu_to_meta = mapper.build_mappings(chapters)
-    print(f"[STEP] Mapeando códigos/ids (apu:{len(apu_to_subcat_id)}, cat:{len(code_to_category_id)}), con metadatos apu({len(apu_to_meta)})...")
+    log.info("[STEP] Mapeando códigos/ids (apu:%s, cat:%s), con metadatos apu(%s)...", len(apu_to_subcat_id), len(code_to_category_id), len(apu_to_meta))
 
     mapped_dir.mkdir(parents=True, exist_ok=True)
     files = mapper.list_json_files(json_input_dir)
-    count = 0
-    for p in files:
+
+    def _map_one(p: Path) -> Tuple[Path, Optional[Path], Optional[Dict[str, Any]], Optional[Exception]]:
         try:
             data = _load_json(p)
         except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}': {e}")
-            continue
+            return p, None, None, e
 
         new_data = mapper.transform_budget_json(data, apu_to_subcat_id, code_to_category_id, apu_to_meta)
 
-        # Resolver budget_id
-        if p.name in budget_map:
-            resolved_budget_id = budget_map.get(p.name)
+        # Resolver budget_id (llaves de budget_map canónicas, ver mapper.load_budget_map)
+        key = p.name.strip().lower()
+        if key in budget_map:
+            resolved_budget_id = budget_map[key]
         elif budget_id is not None:
             resolved_budget_id = budget_id
         else:
@@ -251,16 +402,36 @@ def step_map_chapters(json_input_dir: Path, mapped_dir: Path, uris: Dict[str, An
                 new_data.pop("cedula", None)
 
         out_path = mapped_dir / p.name
-        _save_json(out_path, new_data)
-        print(f"[OK] Mapeado: {out_path}")
-        count += 1
-    print(f"[RESUMEN] Mapeados: {count} archivos en '{mapped_dir.resolve()}'")
-    return count
+        if persist:
+            _save_json(out_path, new_data)
+        return p, out_path, new_data, None
+
+    # Cada archivo es independiente y el trabajo es sobre todo parseo/escritura de JSON y disco;
+    # map() entrega los resultados en orden, así que los mensajes salen igual que en secuencial
+    mapped: List[Tuple[Path, Dict[str, Any]]] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files) or 1))) as executor:
+        for p, out_path, new_data, err in executor.map(_map_one, files):
+            if out_path is None or new_data is None:
+                log.warning("[WARN] No se pudo leer '%s': %s", p.name, err)
+                continue
+            if persist:
+                log.info("[OK] Mapeado: %s", out_path)
+            else:
+                # Sin --persist-intermediate no se escribe nada: no nombrar una ruta que no existe
+                log.info("[OK] Mapeado (en memoria): %s", p.name)
+            mapped.append((out_path, new_data))
+    count = len(mapped)
+    if persist:
+        log.info("[RESUMEN] Mapeados: %s archivos en '%s'", count, mapped_dir.resolve())
+    else:
+        log.info("[RESUMEN] Mapeados: %s archivos (en memoria)", count)
+    _flush_log()
+    return mapped
 
 
-def step_enrich_and_build(mapped_dir: Path, uris: Dict[str, Any], token: Optional[str], extra_headers: Optional[Dict[str, str]], users_file: Optional[Path], beneficiary_file: Optional[Path], template_name: str) -> tuple[int, list[dict]]:
-    # Preparar user_map
-    user_map: Dict[str, Dict[str, Any]] = {}
+def step_enrich_and_build(mapped_dir: Path, uris: Dict[str, Any], token: Optional[str], extra_headers: Optional[Dict[str, str]], users_file: Optional[Path], beneficiary_file: Optional[Path], template_name: str, max_workers: int = 16, ben_cache_path: Optional[Path] = None, ben_ttl: float = 0.0, users_future: Optional[Future] = None, mapped: Optional[List[Tuple[Path, Dict[str, Any]]]] = None, users_cache_path: Optional[Path] = None, users_ttl: float = payloads.DEFAULT_USERS_TTL) -> tuple[int, list[dict]]:
+    # Preparar user_map: documento (int) -> (budget_id, id), igual que build_payloads
+    user_map: Dict[int, Tuple[Any, Any]] = {}
     try:
         if users_file:
             users_raw = _load_json(users_file)
@@ -270,43 +441,59 @@ def step_enrich_and_build(mapped_dir: Path, uris: Dict[str, Any], token: Optiona
                 users = users_raw
             else:
                 raise RuntimeError("Formato inválido en users-file")
-            print(f"[INFO] Usuarios desde archivo local: {len(users)}")
+            log.info("[INFO] Usuarios desde archivo local: %s", len(users))
         else:
-            print("[INFO] Consultando get_users...")
-            users = payloads.fetch_get_users(uris, token=token, extra_headers=extra_headers)
-            print(f"[INFO] Usuarios recibidos: {len(users)}")
-        for u in users:
-            doc = payloads.normalize_digits(u.get("document_number"))
-            if not doc:
-                continue
-            user_map[doc] = {"budget_id": u.get("budget_id"), "id": u.get("id")}
+            log.info("[INFO] Consultando get_users...")
+            if users_future is not None:
+                users = users_future.result()
+            else:
+                users = payloads.fetch_get_users(uris, token=token, extra_headers=extra_headers, cache_path=users_cache_path, ttl=users_ttl)
+            log.info("[INFO] Usuarios recibidos: %s", len(users))
+        # Tuplas con llave int en vez de un dict por usuario: mucha menos memoria con miles de
+        # usuarios; `for doc in (...,)` liga el documento normalizado una sola vez por usuario
+        user_map = {
+            int(doc): (u.get("budget_id"), u.get("id"))
+            for u in users
+            for doc in (payloads.normalize_digits(u.get("document_number")),)
+            if doc
+        }
+        # Solo se conservan document_number -> (budget_id, id); liberar el listado completo
+        del users
     except Exception as e:
-        print(f"[WARN] No se pudo obtener users: {e}")
+        log.warning("[WARN] No se pudo obtener users: %s", e)
         user_map = {}
 
-    reference = payloads.get_payload_reference(uris, template_name)
+    build_payload = payloads.compile_payload_builder(payloads.get_payload_reference(uris, template_name))
     beneficiary_offline: Optional[Dict[str, Any]] = None
     if beneficiary_file:
         beneficiary_offline = _load_json(beneficiary_file)
         if not isinstance(beneficiary_offline, dict):
             raise RuntimeError("El beneficiary-file debe ser un objeto JSON")
-        print(f"[INFO] Beneficiary desde archivo local: {beneficiary_file}")
+        log.info("[INFO] Beneficiary desde archivo local: %s", beneficiary_file)
 
     built = 0
     skipped_false: list[dict] = []
-    for p in sorted(mapped_dir.glob("*.json")):
-        try:
-            data = _load_json(p)
-        except Exception as e:
-            print(f"[WARN] No se pudo leer '{p.name}': {e}")
-            continue
-
-        # Enriquecer con id/budget_id/exist
-        ced = payloads.normalize_digits(data.get("beneficiary_document")) or payloads.normalize_digits(data.get("cedula"))
-        info = user_map.get(ced) if ced else None
+    pending: List[Tuple[Path, Dict[str, Any], Any]] = []
+    def _iter_mapped() -> Iterator[Tuple[Path, Dict[str, Any]]]:
+        # Datos en memoria del paso de mapeo si se pasaron; si no, leer mapped_dir
+        if mapped is not None:
+            yield from mapped
+            return
+        for p in sorted(mapped_dir.glob("*.json")):
+            try:
+                yield p, _load_json(p)
+            except Exception as e:
+                log.warning("[WARN] No se pudo leer '%s': %s", p.name, e)
+
+    normalize_digits = payloads.normalize_digits
+    for p, data in _iter_mapped():
+        # Enriquecer con id/budget_id/exist. El documento normalizado se calcula una vez por archivo
+        # y se reutiliza abajo (antes se volvía a normalizar para el reporte de exist=false)
+        doc = normalize_digits(data.get("beneficiary_document"))
+        ced = doc or normalize_digits(data.get("cedula"))
+        info = user_map.get(int(ced)) if ced else None
         if info:
-            data["budget_id"] = info.get("budget_id")
-            data["id"] = info.get("id")
+            data["budget_id"], data["id"] = info
             data["exist"] = True
         else:
             data.setdefault("budget_id", None)
@@ -314,33 +501,66 @@ def step_enrich_and_build(mapped_dir: Path, uris: Dict[str, Any], token: Optiona
             data["exist"] = False
 
         # Si no existe el usuario (exist=false), no construir payload
-        if data.get("exist") is False:
+        if not info:
             skipped_false.append({
                 "file": p.name,
-                "beneficiary_document": payloads.normalize_digits(data.get("beneficiary_document")) or "",
+                "beneficiary_document": doc or "",
             })
-            print(f"[INFO] '{p.name}' exist=false; se omite payload")
+            log.info("[INFO] '%s' exist=false; se omite payload", p.name)
             continue
 
         user_id = data.get("id")
         if user_id is None and not beneficiary_offline:
-            print(f"[WARN] '{p.name}' no tiene 'id' y no hay beneficiary offline; se omite payload")
+            log.warning("[WARN] '%s' no tiene 'id' y no hay beneficiary offline; se omite payload", p.name)
             continue
 
-        # Obtener beneficiary
-        try:
-            ben = beneficiary_offline if beneficiary_offline is not None else payloads.fetch_get_beneficiary(uris, user_id, token=token, extra_headers=extra_headers)
-        except Exception as e:
-            print(f"[WARN] No se pudo obtener beneficiary para '{p.name}': {e}")
-            continue
+        pending.append((p, data, user_id))
+
+    # La consulta de beneficiaries puede tardar: mostrar antes lo acumulado del primer recorrido
+    _flush_log()
+    # Obtener beneficiaries: offline, o en paralelo con una sola consulta por user_id (las llamadas
+    # son I/O de red, así que un pool de hilos las solapa sin pelear por el GIL)
+    beneficiaries: Dict[Any, Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = {}
+    if beneficiary_offline is None and pending:
+        # Caché en disco entre corridas, por user_id (y URL/token): dentro de ben_ttl se reutiliza sin
+        # red y, vencido, se revalida con GET condicional (ETag/Last-Modified). Al guardar se conservan
+        # solo los user_id de esta corrida
+        http_cache = payloads.load_beneficiary_cache(ben_cache_path) if ben_cache_path is not None else None
+
+        def _fetch(user_id: Any) -> Tuple[Any, Optional[Dict[str, Any]], Optional[Exception]]:
+            try:
+                ben = payloads.fetch_get_beneficiary(uris, user_id, token=token, extra_headers=extra_headers, cache=http_cache, ttl=ben_ttl)
+                return user_id, ben, None
+            except Exception as e:
+                return user_id, None, e
+
+        unique_ids = list(dict.fromkeys(user_id for _, _, user_id in pending))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_ids)))) as executor:
+            for user_id, ben, err in executor.map(_fetch, unique_ids):
+                beneficiaries[user_id] = (ben, err)
+        if ben_cache_path is not None:
+            try:
+                payloads.save_beneficiary_cache(ben_cache_path, http_cache, unique_ids)
+            except Exception as e:
+                log.warning("[WARN] No se pudo guardar el caché de beneficiaries: %s", e)
+
+    for p, data, user_id in pending:
+        if beneficiary_offline is not None:
+            ben = beneficiary_offline
+        else:
+            ben, err = beneficiaries[user_id]
+            if err is not None:
+                log.warning("[WARN] No se pudo obtener beneficiary para '%s': %s", p.name, err)
+                continue
 
         # Construir payload y escribir in-place
-        pay = payloads.build_payload(reference, data, ben)
+        pay = build_payload(data, ben)
         _save_json(p, pay)
-        print(f"[OK] Payload (in-place): {p}")
+        log.info("[OK] Payload (in-place): %s", p)
         built += 1
 
-    print(f"[RESUMEN] Payloads generados: {built} en '{mapped_dir.resolve()}'")
+    log.info("[RESUMEN] Payloads generados: %s en '%s'", built, mapped_dir.resolve())
+    _flush_log()
     return built, skipped_false
 
 
@@ -358,6 +578,8 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--elem-row-start", type=int, default=12)
     p.add_argument("--elem-col-end", default="S")
     p.add_argument("--elem-row-end", type=int, default=27)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos para leer los .xlsx en paralelo; 1 = secuencial")
+    p.add_argument("--lector", choices=["openpyxl", "xml", "calamine"], default="openpyxl", help="Lector de .xlsx (ver main.py)")
     # Config y endpoints
     p.add_argument("--uris", default="URIS.json")
     p.add_argument("--config", default="config.json")
@@ -369,12 +591,26 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--budget-id", type=int, default=None)
     p.add_argument("--budget-map", default=None, help="Ruta a JSON {\"<archivo.json>\": budget_id}")
     p.add_argument("--template", default="budget_payload")
+    p.add_argument("--no-cache", action="store_true", help="Reprocesar todos los .xlsx sin usar ni actualizar el manifiesto de extracción (.cache/run_all/extract)")
+    p.add_argument("--max-workers", type=int, default=16, help="Consultas get_beneficiary concurrentes (por defecto: 16)")
+    p.add_argument("--ben-cache", default=".ben_cache.json", help="Caché en disco de get_beneficiary por user_id (por defecto: .ben_cache.json)")
+    p.add_argument("--no-ben-cache", action="store_true", help="No usar ni actualizar el caché de get_beneficiary")
+    p.add_argument("--ben-ttl", type=float, default=0.0, help="Segundos en que un beneficiary cacheado se usa sin consultar; 0 = siempre revalidar (por defecto: 0)")
+    p.add_argument("--users-ttl", type=float, default=payloads.DEFAULT_USERS_TTL, help="Segundos en que el caché de get_users se usa sin consultar (por defecto: 60)")
+    p.add_argument("--refresh-users", action="store_true", help="Revalidar get_users con el servidor aunque el caché esté vigente")
+    p.add_argument("--no-users-cache", action="store_true", help="No usar ni actualizar el caché en disco de get_users")
     p.add_argument("--no-submit", action="store_true", help="No enviar payloads (por defecto se envían)")
+    p.add_argument(
+        "--persist-intermediate",
+        action="store_true",
+        help="Escribir también los JSON mapeados intermedios en --mapped-dir (por defecto solo se escriben los payloads)",
+    )
     return p.parse_args()
 
 
 def main() -> None:
     args = parse_args()
+    _setup_logging()
     input_dir = Path(args.input_dir)
     json_dir = Path(args.json_dir)
     mapped_dir = Path(args.mapped_dir)
@@ -390,6 +626,21 @@ def main() -> None:
     if not _preflight_auth_or_exit(uris, token, extra_headers, need_online=need_online):
         return
 
+    # get_chapters y get_users no dependen de la extracción: se consultan en segundo plano para que
+    # la espera de red se solape con la lectura de los .xlsx (los pasos 2 y 3 toman el resultado)
+    # get_users usa el mismo caché en disco que build_payloads: dentro de --users-ttl no hay consulta
+    # y, vencido, un GET condicional (ETag) con 304 reutiliza el listado guardado
+    users_cache_path = None if args.no_users_cache else payloads.USERS_CACHE_PATH
+    users_ttl = 0.0 if args.refresh_users else args.users_ttl
+    prefetch = ThreadPoolExecutor(max_workers=2)
+    chapters_future = None
+    users_future = None
+    if not args.chapters_file:
+        chapters_future = prefetch.submit(mapper.fetch_get_chapters, uris, token=token, extra_headers=extra_headers, session=payloads.get_session())
+    if not args.users_file:
+        users_future = prefetch.submit(payloads.fetch_get_users, uris, token=token, extra_headers=extra_headers, cache_path=users_cache_path, ttl=users_ttl)
+    prefetch.shutdown(wait=False)
+
     # Paso 1: XLSX -> JSON
     step_extract_xlsx_to_json(input_dir, json_dir, args)
 
@@ -397,16 +648,27 @@ def main() -> None:
     budget_map: Dict[str, Any] = {}
     if args.budget_map:
         try:
+            _flush_log()
             budget_map = mapper.load_budget_map(args.budget_map)
         except Exception:
             budget_map = {}
     chapters_file = Path(args.chapters_file) if args.chapters_file else None
-    step_map_chapters(json_dir, mapped_dir, uris, token, extra_headers, chapters_file, args.budget_id, budget_map)
+    # Los datos mapeados pasan en memoria al paso 3 (sin releerlos de disco); los intermedios solo se
+    # escriben con --persist-intermediate. Los payloads sí se escriben en mapped_dir en el paso 3.
+    mapped = step_map_chapters(
+        json_dir, mapped_dir, uris, token, extra_headers, chapters_file, args.budget_id, budget_map,
+        chapters_future=chapters_future, persist=args.persist_intermediate,
+    )
 
     # Paso 3 y 4: Enriquecer + Payload in-place
     users_file = Path(args.users_file) if args.users_file else None
     beneficiary_file = Path(args.beneficiary_file) if args.beneficiary_file else None
-    built, skipped_false = step_enrich_and_build(mapped_dir, uris, token, extra_headers, users_file, beneficiary_file, args.template)
+    ben_cache_path = None if args.no_ben_cache else Path(args.ben_cache)
+    built, skipped_false = step_enrich_and_build(
+        mapped_dir, uris, token, extra_headers, users_file, beneficiary_file, args.template,
+        max_workers=args.max_workers, ben_cache_path=ben_cache_path, ben_ttl=args.ben_ttl,
+        users_future=users_future, mapped=mapped, users_cache_path=users_cache_path, users_ttl=users_ttl,
+    )
 
     # Paso 4.5: Envío (por defecto activo; se puede desactivar con --no-submit)
     if submit_enabled:
@@ -420,12 +682,16 @@ def main() -> None:
         json_dir.mkdir(parents=True, exist_ok=True)
         # Limpiar JSON existentes
         removed = 0
-        for p in json_dir.glob("*.json"):
-            try:
-                p.unlink()
-                removed += 1
-            except Exception:
-                pass
+        # os.scandir: solo nombres y tipo cacheado, sin construir un Path por entrada
+        with os.scandir(json_dir) as it:
+            for e in it:
+                if not e.name.endswith(".json"):
+                    continue
+                try:
+                    os.unlink(e.path)
+                    removed += 1
+                except Exception:
+                    pass
         # Copiar solo payloads (archivos que tienen 'beneficiary_id' en el root)
         copied = 0
         skipped = 0
@@ -437,29 +703,51 @@ def main() -> None:
                 continue
             if isinstance(obj, dict) and "beneficiary_id" in obj:
                 dest = json_dir / m.name
-                shutil.copy2(m, dest)
+                # mapped_dir se elimina a continuación: mover (rename, sin copiar bytes) basta; solo si
+                # están en distintos sistemas de archivos (EXDEV) se copia (shutil.copy2 ya usa sendfile
+                # en Linux) y se borra el origen. Un fallo en un archivo no detiene los demás
+                try:
+                    try:
+                        os.replace(m, dest)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        try:
+                            shutil.copy2(m, dest)
+                        except OSError:
+                            # No dejar un destino a medio copiar
+                            dest.unlink(missing_ok=True)
+                            raise
+                        os.unlink(m)
+                except OSError as e:
+                    log.warning("[WARN] No se pudo mover '%s' a '%s': %s", m.name, json_dir, e)
+                    skipped += 1
+                    continue
                 copied += 1
             else:
                 skipped += 1
-        print(f"[FINAL] Reemplazado '{json_dir.name}': quitados {removed}, copiados {copied} payload(s), omitidos {skipped}")
+        log.info("[FINAL] Reemplazado '%s': quitados %s, copiados %s payload(s), omitidos %s", json_dir.name, removed, copied, skipped)
     except Exception as e:
-        print(f"[WARN] No se pudo reemplazar '{json_dir}': {e}")
+        log.warning("[WARN] No se pudo reemplazar '%s': %s", json_dir, e)
 
     # Limpiar carpeta mapped_dir
     try:
         if mapped_dir.exists():
-            for p in mapped_dir.glob("*"):
-                try:
-                    if p.is_file() or p.is_symlink():
-                        p.unlink(missing_ok=True)
-                except Exception:
-                    pass
+            with os.scandir(mapped_dir) as it:
+                for e in it:
+                    try:
+                        if e.is_file() or e.is_symlink():
+                            os.unlink(e.path)
+                    except Exception:
+                        pass
             # Eliminar directorio vacío
             mapped_dir.rmdir()
-            print(f"[CLEANUP] Eliminada carpeta '{mapped_dir.name}'")
+            log.info("[CLEANUP] Eliminada carpeta '%s'", mapped_dir.name)
     except Exception as e:
-        print(f"[WARN] No se pudo eliminar '{mapped_dir}': {e}")
+        log.warning("[WARN] No se pudo eliminar '%s': %s", mapped_dir, e)
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el ejecutable congelado (PyInstaller) de Windows
+    multiprocessing.freeze_support()
     main()